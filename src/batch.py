@@ -0,0 +1,188 @@
+"""
+    src.Batch
+    =========
+    This file contains the code to run a batch of cases from a manifest,
+    with a local pool of worker processes.
+
+    Manifest format:
+    ----------------
+    {
+        "jobs": [
+            {
+                "name": {{ name }},             (optional, default: index)
+                "args": [{{ argument }}, ...],  (command line arguments)
+                "cpus": {{ cpus }},             (optional, default: 1)
+                "memory": {{ memory in MB }}    (optional, default: 0)
+            },
+            ...
+        ]
+    }
+
+    Unless the args of a job set them, the job is run with --jobs set to its
+    cpus and --memory-budget set to its memory.
+
+    The status of every job is written back to the manifest while the batch
+    runs ("status", "started", "finished", "duration", "returncode" and
+    "log"). Jobs with status "done" are skipped when the batch is run again.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class BatchException(Exception):
+    """Custom exception for invalid manifests."""
+    pass
+
+
+class Batch:
+    """Runs the jobs of a manifest within a CPU and memory budget. A job
+    is started when its CPUs and memory fit in what is left of the budget,
+    a job that needs more than the whole budget is run on its own.
+    """
+    manifest_path: str
+    script: str
+    cpus: int
+    memory: int
+    poll_interval: float
+    manifest: Dict
+    log_dir: str
+
+    def __init__(self, manifest_path: str, script: str, cpus: int = 1,
+            memory: int = 0, poll_interval: float = 0.2):
+        self.manifest_path = manifest_path
+        self.script = script
+        self.cpus = max(1, cpus)
+        self.memory = memory
+        self.poll_interval = poll_interval
+        self.log_dir = f"{os.path.splitext(manifest_path)[0]}-logs"
+        with open(manifest_path) as f:
+            try:
+                self.manifest = json.load(f)
+            except ValueError as e:
+                raise BatchException(f"Manifest is not valid JSON: {e}") \
+                    from e
+        self._validate()
+
+    def _validate(self):
+        if not isinstance(self.manifest, dict):
+            raise BatchException("Manifest is not an object")
+        jobs = self.manifest.get("jobs")
+        if not isinstance(jobs, list):
+            raise BatchException("Manifest has no list of jobs")
+        names = set()
+        for num, job in enumerate(jobs):
+            if not isinstance(job, dict):
+                raise BatchException(f"Job {num} is not an object")
+            if not isinstance(job.get("args"), list):
+                raise BatchException(f"Job {num} has no list of args")
+            for key in ("cpus", "memory"):
+                value = job.get(key, 0)
+                if isinstance(value, bool) or not isinstance(value, int) \
+                        or value < 0:
+                    raise BatchException(f"Job {num} has an invalid " \
+                        f"{key}, expected a non-negative integer")
+            job.setdefault("name", str(num))
+            if job["name"] in names:
+                raise BatchException(f"Job name {job['name']} is not unique")
+            names.add(job["name"])
+
+    def save(self):
+        """Write the manifest, with the status of the jobs."""
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(temp_path, self.manifest_path)
+
+    @staticmethod
+    def _has_option(args: List[str], *names: str) -> bool:
+        return any(arg.split("=", 1)[0] in names for arg in args)
+
+    def _command(self, job: Dict) -> List[str]:
+        args = [str(arg) for arg in job["args"]]
+        options = []
+        if not self._has_option(args, "-j", "--jobs"):
+            # limit the volumes parsed concurrently to the CPUs of the job
+            options += ["--jobs", str(job.get("cpus", 1))]
+        if job.get("memory", 0) and \
+                not self._has_option(args, "--memory-budget"):
+            # move the trees to disk before the job exceeds its memory
+            options += ["--memory-budget", str(job["memory"])]
+        return [sys.executable, self.script] + options + args
+
+    def _fits(self, job: Dict, running: Dict) -> bool:
+        if not running:
+            return True
+        cpus = sum(j.get("cpus", 1) for j in running.values())
+        memory = sum(j.get("memory", 0) for j in running.values())
+        return cpus + job.get("cpus", 1) <= self.cpus and \
+            (not self.memory or memory + job.get("memory", 0) <= self.memory)
+
+    def _start(self, job: Dict) -> subprocess.Popen:
+        os.makedirs(self.log_dir, exist_ok=True)
+        job["log"] = os.path.join(self.log_dir, f"{job['name']}.log")
+        job["status"] = "running"
+        job["started"] = _now()
+        for key in ("finished", "duration", "returncode"):
+            job.pop(key, None)
+        self.save()
+        print(f"starting job {job['name']}...")
+        with open(job["log"], "w") as log:
+            return subprocess.Popen(self._command(job), stdout=log,
+                stderr=subprocess.STDOUT)
+
+    def _finish(self, job: Dict, process: subprocess.Popen, started: float):
+        job["returncode"] = process.returncode
+        job["status"] = "done" if process.returncode == 0 else "failed"
+        job["finished"] = _now()
+        job["duration"] = round(time.monotonic() - started, 3)
+        self.save()
+        print(f"job {job['name']} {job['status']} in {job['duration']}s")
+
+    def run(self) -> int:
+        """Run all jobs that are not done yet.
+
+        :return: the number of failed jobs
+        """
+        pending = [job for job in self.manifest["jobs"]
+            if job.get("status") != "done"]
+        skipped = len(self.manifest["jobs"]) - len(pending)
+        if skipped:
+            print(f"skipping {skipped} completed job(s)")
+
+        running = {}            # process -> job
+        started = {}            # process -> start time
+        try:
+            while pending or running:
+                for job in list(pending):
+                    if self._fits(job, running):
+                        pending.remove(job)
+                        process = self._start(job)
+                        running[process] = job
+                        started[process] = time.monotonic()
+                for process in list(running):
+                    if process.poll() is not None:
+                        self._finish(running.pop(process), process,
+                            started.pop(process))
+                if running:
+                    time.sleep(self.poll_interval)
+        finally:
+            # only left running when the batch itself was interrupted or
+            # failed, the jobs are stopped so they can be run again
+            for process, job in running.items():
+                process.terminate()
+                process.wait()
+                job["status"] = "interrupted"
+            if running:
+                self.save()
+        return sum(job.get("status") == "failed"
+            for job in self.manifest["jobs"])
@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+from typing import Any, Dict, List, Tuple
+
+FINGERPRINT_FILE: str = "fingerprint.json"
+
+
+class Checkpoint:
+    """On-disk record of the progress of the processing stages of one
+    input, used to resume a run after it has been interrupted.
+
+    The checkpoint is a directory in which every stage is stored in its own
+    file, as an append-only stream of records. Every record contains the
+    position in the input up to which it is complete. Only the results that
+    grow with the input (such as parsed lines) are stored, the results that
+    are derived from them (such as trees) are built again when resuming.
+
+    The fingerprint of the run (its input and the options that affect the
+    results) is stored with the first record of a stage, so a checkpoint is
+    only used by a run with the same fingerprint.
+    """
+    path: str
+    interval: int
+    fingerprint: Dict
+
+    def __init__(self, path: str, interval: int = 100000,
+            fingerprint: Dict = None):
+        self.path = path
+        self.interval = interval
+        self.fingerprint = fingerprint or {}
+
+    def _fingerprint_path(self) -> str:
+        return os.path.join(self.path, FINGERPRINT_FILE)
+
+    def _stage_path(self, stage: str) -> str:
+        return os.path.join(self.path, f"{stage}.pickle")
+
+    def due(self, position: int) -> bool:
+        """Check whether a checkpoint should be made at a position.
+
+        :param position: number of processed input lines
+        :return: whether the interval has been reached
+        """
+        return self.interval > 0 and position % self.interval == 0
+
+    def matches(self) -> bool:
+        """Check whether the checkpoint was made by a run with the same
+        fingerprint. An empty checkpoint matches any run.
+
+        :return: whether the checkpoint can be resumed from
+        """
+        if not os.path.isdir(self.path) or not any(
+                file.endswith(".pickle") for file in os.listdir(self.path)):
+            return True
+        try:
+            with open(self._fingerprint_path()) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False
+        # compare after a round trip, as JSON turns e.g. tuples into lists
+        return stored == json.loads(json.dumps(self.fingerprint))
+
+    def load(self, stage: str) -> Tuple[int, List[Any]]:
+        """Load the records of a stage. An incomplete last record (from
+        being interrupted while writing) is discarded.
+
+        :param stage: the name of the stage
+        :return: the position of the last record and the data of all records
+        """
+        position, records = 0, []
+        if not os.path.exists(self._stage_path(stage)):
+            return position, records
+        with open(self._stage_path(stage), "r+b") as f:
+            valid_end = 0
+            while True:
+                try:
+                    position, data = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError,
+                        AttributeError, IndexError):
+                    f.truncate(valid_end)
+                    break
+                records.append(data)
+                valid_end = f.tell()
+        return position, records
+
+    def append(self, stage: str, position: int, data: Any):
+        """Append a record to a stage.
+
+        :param stage: the name of the stage
+        :param position: number of processed input lines
+        :param data: the data added since the previous record
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.exists(self._stage_path(stage)):
+            with open(self._fingerprint_path(), "w") as f:
+                json.dump(self.fingerprint, f)
+        with open(self._stage_path(stage), "ab") as f:
+            pickle.dump((position, data), f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        """Remove the records of all stages."""
+        if not os.path.isdir(self.path):
+            return
+        for file in os.listdir(self.path):
+            if file.endswith(".pickle") or file == FINGERPRINT_FILE:
+                os.remove(os.path.join(self.path, file))
+        if not os.listdir(self.path):
+            os.rmdir(self.path)
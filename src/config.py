@@ -1,14 +1,58 @@
 import argparse
 import os
+from dateutil.parser import parse as dateutil_parse
+from typing import Dict, List, Optional
+
+from src.index import datetime_ticks
+from src.utils import collect_volumes
+
+
+# Graphviz output formats that can be drawn from a layout
+OUTPUT_FORMATS: List[str] = ["png", "jpg", "jpeg", "gif", "bmp", "svg",
+    "pdf", "ps", "eps", "dot", "xdot", "json"]
+
+
+def _formats(value: str) -> List[str]:
+    formats = [f.strip().lower() for f in value.split(",") if f.strip()]
+    if not formats:
+        raise argparse.ArgumentTypeError("no output formats given")
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown output format(s) " \
+            f"{', '.join(unknown)} (choose from {', '.join(OUTPUT_FORMATS)})")
+    # drop duplicates, every format is written to the same file
+    return list(dict.fromkeys(formats))
 
 
 class Config(object):
-    input_path: str
+    volumes: Dict[str, str]
+    jobs: int
+    window_start: Optional[int]
+    window_end: Optional[int]
+    resume: bool
+    checkpoint_interval: int
+    checkpoint_dir: str
+    cache_size: int
+    memory_budget: int
+    tree_store_path: str
+    follow: bool
+    poll_interval: float
+    batch_manifest: Optional[str]
+    batch_cpus: int
+    batch_memory: int
+    raster_budget: int
+    tiles: bool
+    tile_size: int
+    tile_jobs: int
+    stats_format: Optional[str]
+    render_timeout: Optional[float]
+    prescan: bool
     output_path: str
     output_file: str
     filter: str
     dpi: int
     out_format: str
+    out_formats: List[str]
     origin_states_path: str
     forgery_states_path: str
     horizontal_sep: float
@@ -40,12 +84,73 @@ class Config(object):
             type=int,
             default=100
         )
-        self.parser.add_argument(
+        formats = self.parser.add_mutually_exclusive_group()
+        formats.add_argument(
             "-s",
             "--svg",
             help="Output in SVG format (default is png)",
             action="store_true"
         )
+        formats.add_argument(
+            "--formats",
+            help="Output in multiple formats from a single layout, as a " \
+                "comma separated list (e.g. svg,png,pdf) of " \
+                f"{', '.join(OUTPUT_FORMATS)}",
+            type=_formats,
+            default=None
+        )
+        self.parser.add_argument(
+            "--raster-budget",
+            help="Set the maximum memory in MB for a PNG image, above which " \
+                "the DPI is lowered or the image is tiled (default is 1024)",
+            type=int,
+            default=1024
+        )
+        self.parser.add_argument(
+            "--tiles",
+            help="Output PNG images as tiles in a zoom pyramid",
+            action="store_true"
+        )
+        self.parser.add_argument(
+            "--tile-size",
+            help="Set the width and height of a tile in pixels " \
+                "(default is 1024)",
+            type=int,
+            default=1024
+        )
+        self.parser.add_argument(
+            "--tile-jobs",
+            help="Specify the number of tiles to render concurrently, every " \
+                "tile needs the part of the layout drawn on it in memory " \
+                "(default is 2)",
+            type=int,
+            default=2
+        )
+        self.parser.add_argument(
+            "--render-timeout",
+            help="Set the seconds Graphviz may take to lay out and draw " \
+                "the output, when the layout takes longer it is laid out " \
+                "again with a simplified layout, 0 disables the timeout " \
+                "(default is 3600)",
+            type=float,
+            default=3600
+        )
+        self.parser.add_argument(
+            "--stats",
+            help="Only write a triage report with statistics of every file " \
+                "(ranked by suspicion) instead of visualizing, in CSV " \
+                "(default) or JSON format",
+            choices=["csv", "json"],
+            nargs="?",
+            const="csv",
+            default=None
+        )
+        self.parser.add_argument(
+            "--prescan",
+            help="Only parse and visualize the files that have a forgery " \
+                "state, found with a fast search before parsing",
+            action="store_true"
+        )
         self.parser.add_argument(
             "-O",
             "--origin-states",
@@ -76,10 +181,115 @@ class Config(object):
             type=float,
             default=0.5
         )
-        self.parser.add_argument("input", help="Input file path", type=str)
+        self.parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Specify the number of volumes to parse concurrently " \
+                "(default is the number of CPUs)",
+            type=int,
+            default=os.cpu_count()
+        )
+        self.parser.add_argument(
+            "--from",
+            help="Only include operations at or after this time " \
+                "(e.g. \"2020-10-05 12:02:00\", UTC unless specified)",
+            dest="window_start",
+            type=str,
+            default=None
+        )
+        self.parser.add_argument(
+            "--to",
+            help="Only include operations at or before this time " \
+                "(UTC unless specified)",
+            dest="window_end",
+            type=str,
+            default=None
+        )
+        self.parser.add_argument(
+            "--resume",
+            help="Continue from the checkpoint of an interrupted run with " \
+                "the same options",
+            action="store_true"
+        )
+        self.parser.add_argument(
+            "--checkpoint-interval",
+            help="Save the progress every number of input lines, 0 " \
+                "disables checkpoints (default is 100000)",
+            type=int,
+            default=100000
+        )
+        self.parser.add_argument(
+            "--cache-size",
+            help="Set the number of parsed operations to cache, 0 disables " \
+                "the cache (default is 100000)",
+            type=int,
+            default=100000
+        )
+        self.parser.add_argument(
+            "--memory-budget",
+            help="Set the memory in MB the trees may use before they are " \
+                "moved to an on-disk database, 0 disables this " \
+                "(default is 32768)",
+            type=int,
+            default=32768
+        )
+        self.parser.add_argument(
+            "--follow",
+            help="Keep following the input file(s) while they are written, " \
+                "rendering every file that changes to its own output " \
+                "(stop with Ctrl+C)",
+            action="store_true"
+        )
+        self.parser.add_argument(
+            "--poll-interval",
+            help="Specify the seconds between checks for new lines when " \
+                "following (default is 1)",
+            type=float,
+            default=1
+        )
+        self.parser.add_argument(
+            "--batch",
+            help="Run the cases in a JSON manifest instead of a single case, " \
+                "skipping the cases that completed in a previous run",
+            type=str,
+            default=None
+        )
+        self.parser.add_argument(
+            "--batch-cpus",
+            help="Set the number of CPUs the cases of a batch may use at " \
+                "the same time (default is the number of CPUs)",
+            type=int,
+            default=os.cpu_count()
+        )
+        self.parser.add_argument(
+            "--batch-memory",
+            help="Set the memory in MB the cases of a batch may use at the " \
+                "same time, 0 means no limit (default is 0)",
+            type=int,
+            default=0
+        )
+        self.parser.add_argument(
+            "input",
+            help="Input file path(s) or case directory, one analyser " \
+                "output per volume",
+            type=str,
+            nargs="*"
+        )
 
         args = self.parser.parse_args()
-        self.input_path = args.input
+        if not args.input and not args.batch:
+            self.parser.error("the following arguments are required: input")
+        self.batch_manifest = args.batch
+        self.batch_cpus = max(1, args.batch_cpus)
+        self.batch_memory = max(0, args.batch_memory)
+        self.volumes = collect_volumes(args.input)
+        self.jobs = max(1, args.jobs)
+        self.window_start = self._parse_time(args.window_start)
+        self.window_end = self._parse_time(args.window_end)
+        if self.window_start is not None and self.window_end is not None \
+                and self.window_start > self.window_end:
+            self.parser.error(f"--from {args.window_start} is later than " \
+                f"--to {args.window_end}")
 
         self.output_path, output_file = os.path.split(args.output)
         self.output_file = os.path.splitext(output_file)[0]
@@ -89,8 +299,72 @@ class Config(object):
         self.out_format = "png"
         if args.svg:
             self.out_format = "svg"
+        self.out_formats = args.formats or [self.out_format]
+        self.out_format = self.out_formats[0]
+        self.raster_budget = args.raster_budget * 2 ** 20
+        self.tiles = args.tiles
+        self.tile_size = max(1, args.tile_size)
+        self.tile_jobs = max(1, args.tile_jobs)
+        self.stats_format = args.stats
+        self.render_timeout = args.render_timeout or None
+        self.prescan = args.prescan
 
         self.origin_states_path = args.origin_states
         self.forgery_states_path = args.forgery_states
         self.horizontal_sep = str(args.horizontal_sep)
         self.vertical_sep = str(args.vertical_sep)
+
+        self.resume = args.resume
+        self.checkpoint_interval = max(0, args.checkpoint_interval)
+        self.cache_size = max(0, args.cache_size)
+        self.memory_budget = max(0, args.memory_budget) * 2 ** 20
+        self.follow = args.follow
+        self.poll_interval = max(0.0, args.poll_interval)
+        self.tree_store_path = os.path.join(self.output_path,
+            f".{self.output_file}-trees.sqlite")
+        self.checkpoint_dir = os.path.join(self.output_path,
+            f".{self.output_file}-checkpoint")
+
+    def quarantine_path(self, volume: str) -> str:
+        """Get the path of the file to write the unparseable lines of a
+        volume to.
+
+        :param volume: the name of the volume
+        :return: the quarantine file path
+        """
+        name = self.output_file
+        if len(self.volumes) > 1:
+            name += f"-{volume}"
+        return os.path.join(self.output_path, f"{name}-quarantine.txt")
+
+    def fingerprint(self, volume: str, origin_states: List[str],
+            forgery_states: List[str]) -> Dict:
+        """Describe the input of a volume and the options that affect its
+        results, to check that a checkpoint belongs to this run.
+
+        :param volume: the name of the volume
+        :param origin_states: the origin states of the run
+        :param forgery_states: the forgery states of the run
+        :return: the fingerprint of the run
+        """
+        input_path = self.volumes[volume]
+        stat = os.stat(input_path)
+        return {
+            "input": os.path.abspath(input_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "filter": self.filter,
+            "origin_states": origin_states,
+            "prescan": self.prescan,
+            # prescanning selects the lines on the forgery states
+            "forgery_states": forgery_states if self.prescan else [],
+            "window": [self.window_start, self.window_end]
+        }
+
+    def _parse_time(self, time: Optional[str]) -> Optional[int]:
+        if time is None:
+            return None
+        try:
+            return datetime_ticks(dateutil_parse(time))
+        except (ValueError, OverflowError):
+            self.parser.error(f"invalid time: {time}")
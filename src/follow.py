@@ -0,0 +1,132 @@
+"""
+    src.Follow
+    ==========
+    This file contains the code to follow analyser output files while they
+    are still being written, updating the trees with the appended lines.
+"""
+
+import locale
+import os
+import re
+import time
+from hashlib import sha1
+from typing import Callable, Dict, List, Set
+
+from src.tree import Tree, update_trees
+
+
+class Follower:
+    """Reads the lines appended to a file since the previous read. A line
+    is only returned once it is complete (ends with a newline), or once the
+    file stopped growing, as the analyser does not end its last line with a
+    newline. Such a line is returned again if more is written to it.
+    """
+    input_path: str
+    position: int
+    partial: bytes
+    flushed: bool
+    lines_read: int
+    line_number: int
+    encoding: str
+
+    def __init__(self, input_path: str):
+        self.input_path = input_path
+        self.position = 0
+        self.partial = b""
+        self.flushed = False        # whether partial has been returned
+        self.lines_read = 0         # number of complete lines returned
+        self.line_number = 0        # input line number of the last read
+        self.encoding = locale.getpreferredencoding(False)
+
+    def _decode(self, line: bytes) -> str:
+        return line.decode(self.encoding, errors="replace").rstrip("\r")
+
+    def read_lines(self) -> List[str]:
+        """Read the lines appended since the previous read. The input line
+        number of the first line is stored in line_number.
+
+        :return: the new lines
+        """
+        if not os.path.exists(self.input_path):
+            return []
+        if os.path.getsize(self.input_path) < self.position:
+            # the file was truncated or replaced, start over
+            print(f"{self.input_path} was truncated, reading it again...")
+            self.position = 0
+            self.partial = b""
+            self.flushed = False
+            self.lines_read = 0
+
+        with open(self.input_path, "rb") as f:
+            f.seek(self.position)
+            data = f.read()
+            self.position = f.tell()
+
+        self.line_number = self.lines_read
+        if not data:
+            if self.partial and not self.flushed:
+                # the file stopped growing, return its last line
+                self.flushed = True
+                return [self._decode(self.partial)]
+            return []
+
+        # the last element is the (possibly empty) incomplete line
+        lines = (self.partial + data).split(b"\n")
+        if self.flushed:
+            self.flushed = False
+            if lines[0] == self.partial:
+                # the returned line was complete, only its newline was added
+                lines.pop(0)
+                self.lines_read += 1
+                self.line_number = self.lines_read
+        self.partial = lines.pop()
+        self.lines_read += len(lines)
+        return [self._decode(line) for line in lines]
+
+
+def output_name(output_file: str, file: str) -> str:
+    """Create the name of the output of a single file.
+
+    :param output_file: the name of the output of the case
+    :param file: the (namespaced) file path
+    :return: a name that is safe to use in a file system
+    """
+    safe_file = re.sub(r"[^A-Za-z0-9._-]+", "_", file).strip("_.")
+    digest = sha1(file.encode()).hexdigest()[:8]
+    return f"{output_file}-{safe_file or 'root'}-{digest}"
+
+
+def follow(volumes: Dict[str, str],
+        parse: Callable[[List[str], List[int]], List],
+        render: Callable[[Dict[str, Tree], Set[str]], None],
+        poll_interval: float = 1.0, namespace: bool = False):
+    """Follow the output files of volumes until interrupted (Ctrl+C),
+    parsing the appended lines, updating the affected trees in place and
+    rendering the trees that changed.
+
+    :param volumes: dict with the volume names and their input paths
+    :param parse: function that parses a list of new lines, given their
+        input line numbers
+    :param render: function that renders the changed files of the trees
+    :param poll_interval: seconds to wait between checking for new lines
+    :param namespace: whether to namespace the file paths by volume
+    """
+    followers = {volume: Follower(path) for volume, path in volumes.items()}
+    trees = {}
+    try:
+        while True:
+            changed = set()
+            for volume, follower in followers.items():
+                lines = follower.read_lines()
+                if lines:
+                    line_numbers = list(range(follower.line_number,
+                        follower.line_number + len(lines)))
+                    changed |= update_trees(trees,
+                        parse(lines, line_numbers),
+                        volume if namespace else "")
+            if changed:
+                print(f"{len(changed)} file(s) changed, rendering...")
+                render(trees, changed)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("stopped following")
@@ -0,0 +1,105 @@
+"""
+    src.Index
+    =========
+    This file contains the code to convert the timestamps of parsed
+    operations to intervals, used to select the operations within a time
+    window.
+
+    The timestamp of an operation is converted to an interval of ticks
+    (100 nanoseconds since the epoch, the resolution of NTFS timestamps):
+    - At t:                 [t, t]
+    - From t1 to t2:        [min(t1, t2), max(t1, t2)]
+    - Between t1 and t2:    [min(t1, t2), max(t1, t2)]
+    (the analyser writes some ranges with the later time first)
+    - After t:              [t, infinity]
+
+    A window is only applied once to the operations of a run, so they are
+    selected with a single linear scan instead of building an index. The
+    operations between the first and last selected operation of a line are
+    kept as well, as leaving them out would join operations that do not
+    follow each other in the history.
+"""
+
+import calendar
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+TICKS_PER_SECOND: int = 10 ** 7
+INFINITY: float = float("inf")
+
+
+def datetime_ticks(dt: datetime) -> int:
+    """Convert a datetime to ticks, naive datetimes are taken as UTC.
+
+    :param dt: the datetime to convert
+    :return: the number of ticks since the epoch
+    """
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc)
+    seconds = calendar.timegm(dt.timetuple())
+    return seconds * TICKS_PER_SECOND + dt.microsecond * 10
+
+
+def timestamp_ticks(timestamp: str) -> int:
+    """Convert a single formatted timestamp (as created by
+    Parser.get_operation_timestamp) to ticks.
+
+    :param timestamp: the timestamp, e.g. "2020-10-05T12:01:30.2715742 +0000"
+    :return: the number of ticks since the epoch
+    """
+    date_time, _, offset = timestamp.partition(" ")
+    seconds, _, fraction = date_time.partition(".")
+    dt = datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S")
+    ticks = calendar.timegm(dt.timetuple()) * TICKS_PER_SECOND
+    ticks += int(fraction.ljust(7, "0")[:7])
+    if offset:
+        sign = -1 if offset[0] == "-" else 1
+        offset_seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        ticks -= sign * offset_seconds * TICKS_PER_SECOND
+    return ticks
+
+
+def timestamp_interval(timestamp: str) -> Tuple[int, float]:
+    """Convert the formatted timestamp of an operation to an interval.
+
+    :param timestamp: the timestamp, e.g.
+        "<TIMESTAMP 2020-10-05T12:02:44.2437766 +0000 - 2020-10-05T12:02:44.6067758 +0000 (From)>"
+    :return: the start and end of the interval in ticks
+    """
+    bounds, _, timestamp_type = timestamp[len("<TIMESTAMP "):-1]\
+        .rpartition(" (")
+    bounds = bounds.split(" - ")
+    start = timestamp_ticks(bounds[0])
+    if timestamp_type == "After)":
+        return (start, INFINITY)
+    end = timestamp_ticks(bounds[-1])
+    return (min(start, end), max(start, end))
+
+
+def filter_window(parsed_lines: List, start: Optional[int] = None,
+        end: Optional[int] = None) -> List:
+    """Only keep the operations that overlap a time window, and the
+    operations between them in the history of a line. Lines without any
+    overlapping operations are removed.
+
+    :param parsed_lines: parsed lines as returned by Parser.parse_lines
+    :param start: start of the window in ticks (None for unbounded)
+    :param end: end of the window in ticks (None for unbounded)
+    :return: the parsed lines restricted to the window
+    """
+    if start is None and end is None:
+        return parsed_lines
+    start = -INFINITY if start is None else start
+    end = INFINITY if end is None else end
+
+    filtered_lines = []
+    for filepath, operations in parsed_lines:
+        selected = []
+        for num, operation in enumerate(operations):
+            op_start, op_end = timestamp_interval(operation[2])
+            if op_start <= end and op_end >= start:
+                selected.append(num)
+        if selected:
+            filtered_lines.append((filepath,
+                operations[selected[0]:selected[-1] + 1]))
+    return filtered_lines
@@ -65,10 +65,14 @@
 
 """
 
+import os
 import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dateutil.parser import parse as dateutil_parse
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
+from src.checkpoint import Checkpoint
 from src.config import Config
 
 # Regex to extract the operations from a line. In order it checks for the
@@ -98,6 +102,53 @@ class ParserException(BaseException):
     pass
 
 
+class OperationCache(object):
+    """Size-bounded LRU cache of parsed operation strings, the same
+    operation is often found on many lines and in every alternative history
+    of a file.
+
+    The cached value of an operation is its timestamp, origin actions and
+    normal actions, which depend on the origin states, so these are part of
+    the key.
+    """
+    maxsize: int
+    hits: int
+    misses: int
+    entries: OrderedDict
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+
+    def get(self, key: Tuple) -> Optional[Tuple[str, List[str], List[str]]]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: Tuple, value: Tuple[str, List[str], List[str]]):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return f"<OperationCache: {len(self.entries)}/{self.maxsize} " \
+            f"entries, {self.hits} hits, {self.misses} misses " \
+            f"({self.hit_rate:.1%} hit rate)>"
+
+
 class Parser(object):
     """The Parser class provides serveral (static) methods for
     extracting data from the TimeStampAnalyser. 
@@ -154,9 +205,18 @@ class Parser(object):
         :param line: the line to parse
         :return: the path of the line
         """
-        path_start_index = line.find(".\\")
+        first_operation = ops_regex.search(line)
+        if not first_operation:
+            raise ParserException("No operations found in line")
         # -1 to remove the space before after the file path
-        path_end_index = line.find(ops_regex.search(line).group()) - 1
+        path_end_index = line.find(first_operation.group()) - 1
+        path_start_index = line.find(".\\", 0, path_end_index)
+        if path_start_index == -1:
+            # a path without the ".\" prefix (e.g. of a deleted file)
+            # follows the line number, the "." path is parsed as ""
+            number, _, path = line[:path_end_index].partition(" ")
+            path = path if number.isdigit() else line[:path_end_index]
+            return "" if path == "." else path
         return line[path_start_index:path_end_index]
 
     @staticmethod
@@ -188,33 +248,70 @@ class Parser(object):
         formatted_timestamp += f" ({timestamp_type})>"
         return formatted_timestamp
 
+    @staticmethod
+    def parse_operation(operation: str, origin_states: List[str] = [],
+            cache: OperationCache = None) \
+            -> Tuple[str, List[str], List[str]]:
+        """Parse the timestamp and actions of an operation, and split the
+        actions in origin and normal actions.
+
+        :param operation: the operation to parse
+        :param cache: when given, the cache to look up the operation in
+        :return: the timestamp, the origin actions and the normal actions
+        """
+        if cache is not None:
+            key = (operation, tuple(origin_states))
+            parsed_operation = cache.get(key)
+            if parsed_operation is not None:
+                return parsed_operation
+
+        timestamp = Parser.get_operation_timestamp(operation)
+        actions = Parser.get_operation_actions(operation)
+        normal_actions = []
+        origin_actions = []
+
+        for action in actions:
+            # Remove "(possibly) on other volume", because initial states
+            # are given without this included
+            action_str = action\
+                .replace(", possibly on other volume", "")\
+                .replace(", on other volume", "")
+            if action_str in origin_states:
+                origin_actions.append(action)
+            else:
+                normal_actions.append(action)
+
+        parsed_operation = (timestamp, origin_actions, normal_actions)
+        if cache is not None:
+            cache.put(key, parsed_operation)
+        return parsed_operation
+
     @staticmethod
     def parse_line(line: str, line_no: int = None,
-            origin_states: List[str] = []) -> Tuple[str, List]:
+            origin_states: List[str] = [],
+            cache: OperationCache = None) -> Tuple[str, List]:
         """Parse an entire line.
 
         :param line: the line to parse
+        :param cache: when given, the cache of parsed operations to use
         :return: the file path and the operations in the line
         """
+        try:
+            return Parser._parse_line(line, origin_states, cache)
+        except ParserException as e:
+            raise ParserException(f"Line {line_no}: {e}") from e
+        except (AttributeError, IndexError, ValueError, OverflowError) as e:
+            raise ParserException(f"Line {line_no}: {e!r}") from e
+
+    @staticmethod
+    def _parse_line(line: str, origin_states: List[str],
+            cache: OperationCache = None) -> Tuple[str, List]:
         filepath = Parser.get_file_path(line)
         timestamp_operation_list = []
         previous_path = ""
         for operation in Parser.get_operation_strings(line):
-            timestamp = Parser.get_operation_timestamp(operation)
-            actions = Parser.get_operation_actions(operation)
-            normal_actions = []
-            origin_actions = []
-
-            for action in actions:
-                # Remove "(possibly) on other volume", because initial states
-                # are given without this included
-                action_str = action\
-                    .replace(", possibly on other volume", "")\
-                    .replace(", on other volume", "")
-                if action_str in origin_states:
-                    origin_actions.append(action)
-                else:
-                    normal_actions.append(action)
+            timestamp, origin_actions, normal_actions = \
+                Parser.parse_operation(operation, origin_states, cache)
             path = f"{previous_path} <- {operation}"
             if origin_actions:
                 timestamp_operation_list.append((
@@ -238,17 +335,146 @@ class Parser(object):
 
     @staticmethod
     def parse_lines(lines: List[str], origin_states: List[str] = [],
-            filter: str = "") -> List:
+            filter: str = "", quarantine: List = None,
+            checkpoint: Checkpoint = None,
+            cache: OperationCache = None,
+            line_numbers: List[int] = None) -> List:
         """Parse the an TimeStampAnalyser output file.
 
         :param lines: list of lines
         :param filter: only parse lines that match the filter
+        :param quarantine: when given, unparseable lines are added to this
+            list as (line number, line, error) instead of raising a
+            ParserException
+        :param checkpoint: when given, the progress is saved periodically and
+            parsing continues from the last saved position
+        :param cache: when given, the cache of parsed operations to use
+        :param line_numbers: when the lines are a selection of the input,
+            the input line number of every line (used in errors)
         :return: list of parsed lines
         """
         parsed_lines = []
-        for num, line in enumerate(lines):
+        position = 0
+        if checkpoint:
+            position, records = checkpoint.load("parse")
+            for record_lines, record_quarantine in records:
+                parsed_lines += record_lines
+                if quarantine is not None:
+                    quarantine += record_quarantine
+
+        new_lines, new_quarantine = [], []
+        for num in range(position, len(lines)):
+            line = lines[num]
+            line_no = num if line_numbers is None else line_numbers[num]
             if filter in line:
-                parsed_lines.append(Parser.parse_line(line, line_no=num,
-                    origin_states=origin_states))
+                try:
+                    new_lines.append(Parser.parse_line(line, line_no=line_no,
+                        origin_states=origin_states, cache=cache))
+                except ParserException as e:
+                    if quarantine is None:
+                        raise
+                    new_quarantine.append((line_no, line, str(e)))
+            if checkpoint and checkpoint.due(num + 1):
+                checkpoint.append("parse", num + 1,
+                    (new_lines, new_quarantine))
+                parsed_lines += new_lines
+                if quarantine is not None:
+                    quarantine += new_quarantine
+                new_lines, new_quarantine = [], []
+
+        parsed_lines += new_lines
+        if quarantine is not None:
+            quarantine += new_quarantine
+        if checkpoint and position < len(lines):
+            checkpoint.append("parse", len(lines), (new_lines, new_quarantine))
         return parsed_lines
-        
\ No newline at end of file
+
+    @staticmethod
+    def parse_file(input_path: str, origin_states: List[str] = [],
+            filter: str = "", checkpoint: Checkpoint = None,
+            quarantine_path: str = None, cache_size: int = 0,
+            reader: Callable[[str], Tuple[List[str], List[int]]] = None) \
+            -> List:
+        """Read and parse a TimeStampAnalyser output file.
+
+        :param input_path: path of the file to parse
+        :param filter: only parse lines that match the filter
+        :param checkpoint: checkpoint to save and resume the progress with
+        :param quarantine_path: when given, unparseable lines are written to
+            this file instead of raising a ParserException
+        :param cache_size: maximum number of parsed operations to cache, 0
+            disables the cache
+        :param reader: when given, the function used to read a selection of
+            the lines to parse from the file, returning the lines and their
+            line numbers (e.g. src.prescan.prescan_file)
+        :return: list of parsed lines
+        """
+        line_numbers = None
+        if reader is not None:
+            lines, line_numbers = reader(input_path)
+        else:
+            with open(input_path) as f:
+                lines = f.readlines()
+        quarantine = None if quarantine_path is None else []
+        cache = OperationCache(cache_size) if cache_size > 0 else None
+        parsed_lines = Parser.parse_lines(lines, origin_states=origin_states,
+            filter=filter, quarantine=quarantine, checkpoint=checkpoint,
+            cache=cache, line_numbers=line_numbers)
+        if cache is not None:
+            print(f"operation cache of {input_path}: {cache}")
+        if quarantine:
+            Parser.write_quarantine(quarantine, quarantine_path)
+            print(f"{len(quarantine)} unparseable line(s) of {input_path} " \
+                f"written to {quarantine_path}")
+        return parsed_lines
+
+    @staticmethod
+    def write_quarantine(quarantine: List, quarantine_path: str,
+            append: bool = False):
+        """Write unparseable lines to a quarantine file, each preceded by
+        its error as a comment.
+
+        :param quarantine: the (line number, line, error) of each line
+        :param quarantine_path: path of the file to write
+        :param append: whether to append to an existing file
+        """
+        os.makedirs(os.path.dirname(quarantine_path) or ".", exist_ok=True)
+        with open(quarantine_path, "a" if append else "w") as f:
+            for num, line, error in quarantine:
+                f.write(f"# {error}\n")
+                f.write(line if line.endswith("\n") else f"{line}\n")
+
+    @staticmethod
+    def parse_volumes(volumes: Dict[str, str], origin_states: List[str] = [],
+            filter: str = "", jobs: int = 1,
+            checkpoints: Dict[str, Checkpoint] = {},
+            quarantine_paths: Dict[str, str] = {},
+            cache_size: int = 0,
+            reader: Callable[[str], Tuple[List[str], List[int]]] = None) \
+            -> Dict[str, List]:
+        """Parse the output files of several volumes concurrently.
+
+        :param volumes: dict with the volume names and their input paths
+        :param filter: only parse lines that match the filter
+        :param jobs: maximum number of files to parse at the same time
+        :param checkpoints: the checkpoint of each volume
+        :param quarantine_paths: the quarantine file of each volume
+        :param cache_size: maximum number of parsed operations to cache for
+            each volume
+        :param reader: when given, the function used to read a selection of
+            the lines to parse from each file
+        :return: dict with the volume names and their parsed lines
+        """
+        if jobs == 1 or len(volumes) == 1:
+            return {volume: Parser.parse_file(path, origin_states, filter,
+                    checkpoints.get(volume), quarantine_paths.get(volume),
+                    cache_size, reader)
+                for volume, path in volumes.items()}
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {volume: executor.submit(Parser.parse_file, path,
+                    origin_states, filter, checkpoints.get(volume),
+                    quarantine_paths.get(volume), cache_size, reader)
+                for volume, path in volumes.items()}
+            return {volume: future.result()
+                for volume, future in futures.items()}
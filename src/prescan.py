@@ -0,0 +1,124 @@
+"""
+    src.Prescan
+    ===========
+    This file contains the code to select the lines of suspicious files
+    before parsing, so only those have to be parsed.
+
+    A file is suspicious when any of its lines contains a forgery state.
+    The forgery states are searched for in the raw bytes of the input, and
+    the lines of the suspicious files are selected in a single pass over
+    the raw lines, only the matched lines are decoded and checked.
+"""
+
+import locale
+import mmap
+import re
+from typing import List, Set, Tuple
+
+from src.parser import Parser, ParserException
+
+# The start of the first operation of a line, which ends its file path
+operation_start_regex = re.compile(rb" \((?:At|From|Between|After) [0-9]")
+
+
+def _line_at(data, pos: int) -> Tuple[int, int]:
+    start = data.rfind(b"\n", 0, pos) + 1
+    end = data.find(b"\n", pos)
+    if end == -1:
+        end = len(data)
+    return start, end
+
+
+def _decode(line: bytes, encoding: str) -> str:
+    return line.decode(encoding, errors="replace").rstrip("\r")
+
+
+def find_suspicious_paths(data, forgery_states: List[str],
+        encoding: str = "utf-8") -> Set[str]:
+    """Find the file paths of the lines that contain a forgery state.
+
+    :param data: the input as bytes (or mmap)
+    :param forgery_states: the forgery states to search for
+    :param encoding: the encoding of the input
+    :return: the file paths of the suspicious files
+    """
+    paths = set()
+    for state in forgery_states:
+        needle = state.encode(encoding)
+        pos = data.find(needle)
+        while pos != -1:
+            start, end = _line_at(data, pos)
+            try:
+                paths.add(Parser.get_file_path(
+                    _decode(data[start:end], encoding)))
+            except ParserException:
+                pass
+            pos = data.find(needle, end)
+    return paths
+
+
+def _path_key(prefix: bytes) -> bytes:
+    # the file path in the text before the first operation of a line, as
+    # found by Parser.get_file_path
+    start = prefix.find(b".\\")
+    if start != -1:
+        return prefix[start:]
+    number, _, path = prefix.partition(b" ")
+    path = path if number.isdigit() else prefix
+    return b"" if path == b"." else path
+
+
+def select_lines(data, paths: Set[str],
+        encoding: str = "utf-8") -> List[Tuple[int, str]]:
+    """Select all lines of the given file paths, in a single pass over the
+    input.
+
+    :param data: the input as bytes (or mmap)
+    :param paths: the file paths to select the lines of
+    :param encoding: the encoding of the input
+    :return: the line number (counting from 0) and line of every selected
+        line, in input order
+    """
+    keys = {path.encode(encoding) for path in paths}
+    selected = []
+    start, num = 0, 0
+    while start < len(data):
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = len(data)
+        line = data[start:end]
+        operation = operation_start_regex.search(line)
+        if operation and _path_key(line[:operation.start()]) in keys:
+            decoded_line = _decode(line, encoding)
+            try:
+                if Parser.get_file_path(decoded_line) in paths:
+                    selected.append((num, decoded_line))
+            except ParserException:
+                pass
+        start = end + 1
+        num += 1
+    return selected
+
+
+def prescan_file(input_path: str,
+        forgery_states: List[str]) -> Tuple[List[str], List[int]]:
+    """Read only the lines of the files with forgery states from a
+    TimeStampAnalyser output file.
+
+    :param input_path: path of the file to prescan
+    :param forgery_states: the forgery states to search for
+    :return: the lines of the suspicious files and their line numbers in
+        the input
+    """
+    encoding = locale.getpreferredencoding(False)
+    with open(input_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:          # empty files cannot be mapped
+            return [], []
+        with data:
+            paths = find_suspicious_paths(data, forgery_states, encoding)
+            selected = select_lines(data, paths, encoding)
+    print(f"prescan of {input_path}: {len(paths)} suspicious file(s), " \
+        f"{len(selected)} line(s)")
+    return [line for _, line in selected], [num for num, _ in selected]
@@ -0,0 +1,116 @@
+"""
+    src.Stats
+    =========
+    This file contains the code to create a triage report of the trees,
+    without visualizing them.
+
+    For every file the report contains:
+    - rank:             position when ranked on suspicion (1 is most suspicious)
+    - file:             the (namespaced) file path
+    - histories:        number of alternative histories (input lines)
+    - nodes:            number of operations in the tree
+    - depth:            length of the longest history
+    - width:            maximum number of operations at the same depth
+    - origin_actions:   number of origin state actions
+    - forgery_actions:  number of forgery state actions
+    - first:            earliest timestamp of an operation
+    - last:             latest timestamp of an operation
+    - span:             seconds between the first and last timestamp
+
+    Files are ranked on their forgery actions, and then on their number of
+    histories and depth (uncertain histories are more worth looking at).
+"""
+
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from src.index import INFINITY, TICKS_PER_SECOND, timestamp_interval
+from src.tree import Tree
+
+REPORT_FIELDS: List[str] = ["rank", "file", "histories", "nodes", "depth",
+    "width", "origin_actions", "forgery_actions", "first", "last", "span"]
+
+
+def format_ticks(ticks: int) -> str:
+    """Format ticks as an ISO 8601 UTC timestamp with 100ns precision.
+
+    :param ticks: number of ticks since the epoch
+    :return: the formatted timestamp
+    """
+    seconds, fraction = divmod(ticks, TICKS_PER_SECOND)
+    dt = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=seconds)
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{fraction:07d}Z"
+
+
+def tree_stats(file: str, tree: Tree, forgery_states: List[str] = []) -> Dict:
+    """Calculate the statistics of a single tree.
+
+    :param file: the file path of the tree
+    :param tree: the tree to calculate the statistics of
+    :param forgery_states: the forgery states to count
+    :return: the statistics of the tree
+    """
+    stats = {"file": file, "histories": tree.histories, "nodes": 0,
+        "depth": 0, "width": 0, "origin_actions": 0, "forgery_actions": 0,
+        "first": "", "last": "", "span": 0.0}
+    first, last = INFINITY, -INFINITY
+
+    level = tree.root.children.copy()
+    while level:
+        stats["depth"] += 1
+        stats["width"] = max(stats["width"], len(level))
+        next_level = []
+        for node in level:
+            stats["nodes"] += 1
+            if node.origin_state:
+                stats["origin_actions"] += len(node.actions)
+            stats["forgery_actions"] += sum(action in forgery_states
+                for action in node.actions)
+
+            start, end = timestamp_interval(node.timestamp)
+            first = min(first, start)
+            last = max(last, start if end == INFINITY else end)
+            next_level += node.children
+        level = next_level
+
+    if stats["nodes"]:
+        stats["first"] = format_ticks(first)
+        stats["last"] = format_ticks(last)
+        stats["span"] = (last - first) / TICKS_PER_SECOND
+    return stats
+
+
+def case_stats(trees: Dict[str, Tree],
+        forgery_states: List[str] = []) -> List[Dict]:
+    """Calculate the statistics of all trees, ranked on suspicion.
+
+    :param trees: the trees to calculate the statistics of
+    :param forgery_states: the forgery states to count
+    :return: the statistics of every tree, most suspicious first
+    """
+    report = [tree_stats(file, tree, forgery_states)
+        for file, tree in trees.items()]
+    report.sort(key=lambda stats: (-stats["forgery_actions"],
+        -stats["histories"], -stats["depth"], stats["file"]))
+    for rank, stats in enumerate(report, start=1):
+        stats["rank"] = rank
+    return report
+
+
+def write_report(report: List[Dict], path: str, out_format: str = "csv"):
+    """Write a report to a CSV or JSON file.
+
+    :param report: the statistics as returned by case_stats
+    :param path: the path of the file to write
+    :param out_format: either "csv" or "json"
+    """
+    with open(path, "w", newline="") as f:
+        if out_format == "json":
+            json.dump([{field: stats[field] for field in REPORT_FIELDS}
+                for stats in report], f, indent=4)
+        else:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(report)
@@ -1,8 +1,26 @@
-from typing import List, Dict
+import json
+import os
+import sqlite3
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Dict, Optional, Set, Tuple
 from hashlib import sha512
 
 from src.parser import Parser
 
+# Separates the volume name from the file path in the keys of the trees of
+# multiple volumes
+VOLUME_SEPARATOR = ":"
+
+# Estimate of the memory used by a node (the object, its id, its list of
+# children, its entry in the tree, its timestamp and its actions) excluding
+# the text of its operation and path, which is counted by its length. Used
+# to decide when to spill the trees to disk. With the operation cache the
+# timestamps and actions are shared between nodes, so it then overestimates.
+NODE_SIZE_ESTIMATE = 768
+
+# Action suffixes that mark an operation as (possibly) done on another volume
+OTHER_VOLUME_SUFFIXES = (", possibly on other volume", ", on other volume")
+
 
 class Node:
     id: str
@@ -13,9 +31,9 @@ class Node:
     children: List
     origin_state: bool
 
-    def __init__(self, operation: tuple):
+    def __init__(self, operation: tuple, namespace: str = ""):
         self.operation = operation[0]
-        self.id = Node.generate_id(operation[1], operation[4])
+        self.id = Node.generate_id(operation[1], operation[4], namespace)
         self.path = operation[1]
         self.timestamp = operation[2]
         self.actions = operation[3]
@@ -26,8 +44,12 @@ class Node:
             self.origin_state = False
 
     @staticmethod
-    def generate_id(path: str, state: str = "normal") -> str:
-        return sha512(f"{path}:{state}".encode()).hexdigest()
+    def generate_id(path: str, state: str = "normal",
+            namespace: str = "") -> str:
+        node_key = f"{path}:{state}"
+        if namespace:
+            node_key = f"{namespace}{VOLUME_SEPARATOR}{node_key}"
+        return sha512(node_key.encode()).hexdigest()
         
     def add_child(self, child):
         self.children.append(child)
@@ -39,17 +61,28 @@ class Node:
 class Tree:
     tree: Dict
     root: Node
+    filename: str
+    volume: str
+    histories: int
 
-    def __init__(self, filename: str = ""):
+    def __init__(self, filename: str = "", volume: str = ""):
         self.tree = {}
-        self.root = Node(("ROOT", " <- ", "NOW", [filename], "normal"))
+        self.filename = filename
+        self.volume = volume
+        self.histories = 0      # number of input lines of the file
+        self.root = Node(("ROOT", " <- ", "NOW", [filename], "normal"), volume)
         self.tree.update({self.root.id: self.root})
         
-    def add_node(self, operation: tuple, parent: tuple = None):
+    def add_node(self, operation: tuple, parent: tuple = None) -> Node:
+        """Add an operation to the tree, below the operation of its parent.
+
+        :return: the new node, or None when the operation is already in
+            the tree
+        """
         node = self.get_node(operation)
         node_created = False
         if not node:
-            node = Node(operation)
+            node = Node(operation, self.volume)
             node_created = True
                     
         # If no explicit parent is given, it is linked to the root
@@ -64,26 +97,488 @@ class Tree:
         if node_created:
             self.tree.update({node.id: node})
             parent.add_child(node)
+            return node
+        return None
 
     def get_node(self, node: str) -> Node:
-        node_id = Node.generate_id(node[1], node[4]) 
+        node_id = Node.generate_id(node[1], node[4], self.volume) 
         node = self.tree.get(node_id)
         return node
 
 
-def generate_trees(lines: List[tuple]) -> Dict[str, Tree]:
-    trees = {}
+class TreeStore:
+    """SQLite database that trees are moved to when the estimated memory
+    used by the in-memory trees exceeds a budget. The nodes of all trees are
+    stored in one table, indexed on their tree and parent, so the children
+    of a node can be looked up without loading the whole tree. New nodes are
+    inserted in batches.
+    """
+    path: str
+    memory_budget: int
+    batch_size: int
+    memory_used: int
+    spilled: bool
+
+    def __init__(self, path: str, memory_budget: int,
+            batch_size: int = 10000):
+        self.path = path
+        self.memory_budget = memory_budget
+        self.batch_size = batch_size
+        self.memory_used = 0
+        self.spilled = False
+        self._connection = None
+        self._pending = {}          # (tree id, node id) -> row
+        self._sequence = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.executescript("""
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS trees (
+                    tree_id INTEGER PRIMARY KEY,
+                    filename TEXT,
+                    volume TEXT
+                );
+                CREATE TABLE IF NOT EXISTS nodes (
+                    tree_id INTEGER,
+                    id TEXT,
+                    parent TEXT,
+                    seq INTEGER,
+                    operation TEXT,
+                    path TEXT,
+                    timestamp TEXT,
+                    actions TEXT,
+                    origin INTEGER,
+                    PRIMARY KEY (tree_id, id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS nodes_parent
+                    ON nodes (tree_id, parent, seq);
+            """)
+            self._sequence = self._connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM nodes").fetchone()[0]
+        return self._connection
+
+    def account(self, nodes: int, text_size: int = 0) -> bool:
+        """Add the estimated memory of new in-memory nodes, that is freed
+        when they are moved to the store.
+
+        :param nodes: the number of new nodes
+        :param text_size: the total length of the operations and paths of
+            the new nodes
+        :return: whether the memory budget is exceeded
+        """
+        self.memory_used += nodes * NODE_SIZE_ESTIMATE + text_size
+        return self.memory_budget > 0 and \
+            self.memory_used > self.memory_budget
+
+    def create_tree(self, filename: str = "", volume: str = ""):
+        """Create a new tree in the store.
+
+        :return: the stored tree
+        """
+        tree_id = self.connection.execute(
+            "INSERT INTO trees (filename, volume) VALUES (?, ?)",
+            (filename, volume)).lastrowid
+        return StoredTree(self, tree_id, filename, volume)
+
+    def insert(self, tree_id: int, node: Node, parent_id: Optional[str]):
+        self._sequence += 1
+        self._pending[(tree_id, node.id)] = (tree_id, node.id, parent_id,
+            self._sequence, node.operation, node.path, node.timestamp,
+            json.dumps(node.actions), int(node.origin_state))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending nodes to the database."""
+        if self._pending:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending.values())
+            self._pending = {}
+        if self._connection is not None:
+            self._connection.commit()
+
+    def _node(self, row: tuple):
+        return StoredNode(self, row[0], row[1], row[4:])
+
+    def get(self, tree_id: int, node_id: str):
+        row = self._pending.get((tree_id, node_id))
+        if row is None:
+            row = self.connection.execute(
+                "SELECT * FROM nodes WHERE tree_id = ? AND id = ?",
+                (tree_id, node_id)).fetchone()
+        return None if row is None else self._node(row)
+
+    def children(self, tree_id: int, node_id: str) -> List:
+        self.flush()
+        return [self._node(row) for row in self.connection.execute(
+            "SELECT * FROM nodes WHERE tree_id = ? AND parent = ? " \
+            "ORDER BY seq", (tree_id, node_id))]
+
+    def nodes(self, tree_id: int) -> Iterator:
+        self.flush()
+        for row in self.connection.execute(
+                "SELECT * FROM nodes WHERE tree_id = ? ORDER BY seq",
+                (tree_id,)):
+            yield self._node(row)
+
+    def count(self, tree_id: int) -> int:
+        self.flush()
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM nodes WHERE tree_id = ?",
+            (tree_id,)).fetchone()[0]
+
+    def add_related_files(self, files: List[Tuple[int, str, str, str]]):
+        """Store the trees of which the nodes may be related across
+        volumes in a temporary table, and index the nodes on their
+        timestamp, so related nodes are looked up without loading the
+        trees.
+
+        :param files: (tree id, file name, lowercase file path, volume) of
+            every tree
+        """
+        self.flush()
+        self.connection.executescript("""
+            CREATE TEMP TABLE IF NOT EXISTS related_files (
+                tree_id INTEGER PRIMARY KEY,
+                name TEXT,
+                path TEXT,
+                volume TEXT
+            );
+            DELETE FROM related_files;
+            CREATE INDEX IF NOT EXISTS nodes_timestamp ON nodes (timestamp);
+        """)
+        self.connection.executemany(
+            "INSERT INTO related_files VALUES (?, ?, ?, ?)", files)
+
+    def related_nodes(self, suffixes: Tuple[str, ...]) -> Iterator:
+        """Find the nodes of the related files with an action ending with
+        one of the suffixes. Actions are matched case-insensitively.
+
+        :param suffixes: the action suffixes to look for
+        :return: iterator over (file name, lowercase file path, volume,
+            node) of the nodes
+        """
+        condition = " OR ".join(["n.actions LIKE ?"] * len(suffixes))
+        for row in self.connection.execute(
+                "SELECT f.name, f.path, f.volume, n.* FROM nodes n " \
+                "JOIN related_files f ON f.tree_id = n.tree_id " \
+                f"WHERE {condition} ORDER BY n.tree_id, n.seq",
+                [f"%{json.dumps(suffix)[1:-1]}\"%" for suffix in suffixes]):
+            yield row[0], row[1], row[2], self._node(row[3:])
+
+    def nodes_at(self, name: str, timestamp: str, volume: str) -> Iterator:
+        """Find the nodes with a timestamp of the related files with a
+        file name on the other volumes.
+
+        :param name: the file name
+        :param timestamp: the timestamp of the nodes
+        :param volume: the volume to leave out
+        :return: iterator over (volume, lowercase file path, node) of the
+            nodes, in the order they were added
+        """
+        for row in self.connection.execute(
+                "SELECT f.volume, f.path, n.* FROM nodes n " \
+                "JOIN related_files f ON f.tree_id = n.tree_id " \
+                "WHERE n.timestamp = ? AND f.name = ? AND f.volume != ? " \
+                "ORDER BY n.seq", (timestamp, name, volume)):
+            yield row[0], row[1], self._node(row[2:])
+
+    def spill(self, trees: Dict[str, Tree]) -> Dict[str, Tree]:
+        """Move in-memory trees to the store.
+
+        :param trees: the trees to move
+        :return: the same trees, stored in the database
+        """
+        stored_trees = {}
+        for file, tree in trees.items():
+            if isinstance(tree, StoredTree):
+                stored_trees.update({file: tree})
+                continue
+            stored_tree = self.create_tree(tree.filename, tree.volume)
+            stored_tree.histories = tree.histories
+            nodes_to_store = [tree.root]
+            while nodes_to_store:
+                node = nodes_to_store.pop()
+                for child in node.children:
+                    self.insert(stored_tree.tree_id, child, node.id)
+                nodes_to_store += node.children
+            stored_trees.update({file: stored_tree})
+        self.flush()
+        self.spilled = True
+        return stored_trees
+
+    def close(self, remove: bool = False):
+        """Close the database.
+
+        :param remove: whether to also remove the database file
+        """
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+        if remove:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(f"{self.path}{suffix}"):
+                    os.remove(f"{self.path}{suffix}")
+
+
+class StoredNode(Node):
+    """Node of a StoredTree, its children are loaded when accessed."""
+
+    def __init__(self, store: TreeStore, tree_id: int, node_id: str,
+            row: tuple):
+        self.store = store
+        self.tree_id = tree_id
+        self.id = node_id
+        self.operation, self.path, self.timestamp, actions, origin = row
+        self.actions = json.loads(actions)
+        self.origin_state = bool(origin)
+
+    @property
+    def children(self) -> List:
+        return self.store.children(self.tree_id, self.id)
+
+    def add_child(self, child):
+        self.store.insert(self.tree_id, child, self.id)
+
+
+class StoredNodes(Mapping):
+    """Read-only view of the nodes of a StoredTree by id."""
+
+    def __init__(self, store: TreeStore, tree_id: int):
+        self.store = store
+        self.tree_id = tree_id
+
+    def __getitem__(self, node_id: str) -> StoredNode:
+        node = self.store.get(self.tree_id, node_id)
+        if node is None:
+            raise KeyError(node_id)
+        return node
+
+    def __iter__(self) -> Iterator[str]:
+        return (node.id for node in self.store.nodes(self.tree_id))
+
+    def __len__(self) -> int:
+        return self.store.count(self.tree_id)
+
+    def values(self) -> Iterator[StoredNode]:
+        return self.store.nodes(self.tree_id)
+
+
+class StoredTree(Tree):
+    """Tree of which the nodes are kept in a TreeStore instead of memory."""
+    store: TreeStore
+    tree_id: int
+
+    def __init__(self, store: TreeStore, tree_id: int, filename: str = "",
+            volume: str = ""):
+        self.store = store
+        self.tree_id = tree_id
+        self.filename = filename
+        self.volume = volume
+        self.histories = 0
+        root = Node(("ROOT", " <- ", "NOW", [filename], "normal"), volume)
+        if store.get(tree_id, root.id) is None:
+            store.insert(tree_id, root, None)
+        self.root = store.get(tree_id, root.id)
+        self.tree = StoredNodes(store, tree_id)
+
+    def add_node(self, operation: tuple, parent: tuple = None) -> Node:
+        if self.get_node(operation):
+            return None
+        if not parent:
+            parent = self.root
+        else:
+            parent = self.get_node(parent)
+        if not parent:
+            raise ValueError("Parent not found")
+        node = Node(operation, self.volume)
+        self.store.insert(self.tree_id, node, parent.id)
+        return node
+
+    def get_node(self, node: str) -> Node:
+        return self.store.get(self.tree_id,
+            Node.generate_id(node[1], node[4], self.volume))
+
+
+def volume_path(volume: str, path: str) -> str:
+    """Namespace a file path by the volume it is on.
+
+    :param volume: name of the volume, may be empty
+    :param path: the file path on the volume
+    :return: the namespaced file path
+    """
+    if not volume:
+        return path
+    return f"{volume}{VOLUME_SEPARATOR}{path}"
+
+
+def _add_operations(tree: Tree, operations: List[tuple]) -> Tuple[int, int]:
+    # every line is one alternative history of the file
+    tree.histories += 1
+    nodes, text_size = 0, 0
+    prev_op = None
+    for op in operations:
+        if tree.add_node(op, prev_op):
+            nodes += 1
+            text_size += len(op[0]) + len(op[1])
+        if op[4] == "normal":
+            prev_op = op
+    return nodes, text_size
+
+
+def generate_trees(lines: Iterable[tuple], volume: str = "",
+        store: TreeStore = None, trees: Dict[str, Tree] = None) \
+        -> Dict[str, Tree]:
+    """Generate the trees of the files in the parsed lines.
+
+    The memory of the trees can only be freed by moving them to a store
+    when nothing else refers to the lines (their operations are shared with
+    the nodes), so pass the lines with src.utils.consume to release every line
+    once it has been added.
+
+    :param lines: parsed lines as returned by Parser.parse_lines
+    :param volume: when given, the volume to namespace the trees by
+    :param store: when given, the trees are moved to this store when its
+        memory budget is exceeded
+    :param trees: when given, the trees to add to (such as the trees of
+        other volumes), these are moved to the store as well
+    :return: the trees, keyed by their (namespaced) file path
+    """
+    trees = {} if trees is None else trees
     for line in lines:
-        if line[0] not in trees:
-            tree = Tree()
-            trees.update({line[0]: tree})
+        file = volume_path(volume, line[0])
+        if file not in trees:
+            if store and store.spilled:
+                tree = store.create_tree(line[0], volume)
+            else:
+                tree = Tree(line[0], volume)
+            trees.update({file: tree})
         else:
-            tree = trees.get(line[0])
+            tree = trees.get(file)
 
-        prev_op = None
-        for op in line[1]:
-            tree.add_node(op, prev_op)
-            if op[4] == "normal":
-                prev_op = op
+        nodes, text_size = _add_operations(tree, line[1])
+        if store and not isinstance(tree, StoredTree) and \
+                store.account(nodes, text_size):
+            print(f"memory budget exceeded, moving trees to {store.path}")
+            trees = store.spill(trees)
     return trees
-        
\ No newline at end of file
+
+
+def update_trees(trees: Dict[str, Tree], lines: List[tuple],
+        volume: str = "") -> Set[str]:
+    """Add parsed lines to existing trees, in place.
+
+    :param trees: the trees to update, keyed by their (namespaced) file path
+    :param lines: newly parsed lines as returned by Parser.parse_lines
+    :param volume: when given, the volume to namespace the trees by
+    :return: the file paths of the trees that changed
+    """
+    changed = set()
+    for line in lines:
+        file = volume_path(volume, line[0])
+        tree = trees.get(file)
+        if tree is None:
+            tree = Tree(line[0], volume)
+            trees.update({file: tree})
+        if _add_operations(tree, line[1])[0]:
+            changed.add(file)
+    return changed
+
+
+def _file_name(path: str) -> str:
+    # NTFS file names are case-insensitive
+    return path.split("\\")[-1].lower()
+
+
+def relate_volumes(trees: Dict[str, Tree]) -> List[Tuple[Node, Node]]:
+    """Relate operations done on another volume to the same operation on
+    that volume.
+
+    A node with an "(possibly) on other volume" action is related to a node
+    with the same timestamp of a file with the same file name on each other
+    volume. When several files on a volume match (e.g. copies of a common
+    file such as desktop.ini), only the file with the same relative path is
+    used, or none if there is no such file. Of the matched file the first
+    node with the timestamp is used, so a node has at most one relation per
+    other volume.
+
+    :param trees: the trees of all volumes of a case
+    :return: a list of (node, related node) pairs
+    """
+    volumes_by_name = {}
+    for tree in trees.values():
+        volumes_by_name.setdefault(_file_name(tree.filename), set())\
+            .add(tree.volume)
+    related_trees = [tree for tree in trees.values()
+        if len(volumes_by_name[_file_name(tree.filename)]) > 1]
+    if related_trees and all(isinstance(tree, StoredTree)
+            for tree in related_trees):
+        # look the nodes up in the store instead of loading the trees
+        return _relate_stored_volumes(related_trees)
+
+    # volume -> (file name, timestamp) -> lowercase file path -> first node
+    index = {}
+    other_volume_nodes = []
+    for tree in related_trees:
+        name = _file_name(tree.filename)
+        volume_index = index.setdefault(tree.volume, {})
+        for node in tree.tree.values():
+            volume_index.setdefault((name, node.timestamp), {})\
+                .setdefault(tree.filename.lower(), node)
+            if any(a.endswith(OTHER_VOLUME_SUFFIXES) for a in node.actions):
+                other_volume_nodes.append((tree, name, node))
+
+    relations = []
+    related = set()
+    for tree, name, node in other_volume_nodes:
+        files_by_volume = {volume: volume_index.get((name, node.timestamp),
+                {})
+            for volume, volume_index in index.items()
+            if volume != tree.volume}
+        _relate_node(node, tree.filename.lower(), files_by_volume,
+            relations, related)
+    return relations
+
+
+def _relate_stored_volumes(trees: List[StoredTree]) \
+        -> List[Tuple[Node, Node]]:
+    store = trees[0].store
+    store.add_related_files([(tree.tree_id, _file_name(tree.filename),
+        tree.filename.lower(), tree.volume) for tree in trees])
+    relations = []
+    related = set()
+    for name, path, volume, node in store.related_nodes(
+            OTHER_VOLUME_SUFFIXES):
+        if not any(a.endswith(OTHER_VOLUME_SUFFIXES) for a in node.actions):
+            continue
+        # volume -> lowercase file path -> first node
+        files_by_volume = {}
+        for other_volume, other_path, other_node in store.nodes_at(name,
+                node.timestamp, volume):
+            files_by_volume.setdefault(other_volume, {})\
+                .setdefault(other_path, other_node)
+        _relate_node(node, path, files_by_volume, relations, related)
+    return relations
+
+
+def _relate_node(node: Node, path: str,
+        files_by_volume: Dict[str, Dict[str, Node]],
+        relations: List[Tuple[Node, Node]], related: Set):
+    for files in files_by_volume.values():
+        if len(files) == 1:
+            other_node = next(iter(files.values()))
+        else:
+            other_node = files.get(path)
+        if other_node is None:
+            continue
+        pair = frozenset((node.id, other_node.id))
+        if pair not in related:
+            related.add(pair)
+            relations.append((node, other_node))
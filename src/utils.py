@@ -1,4 +1,5 @@
-from typing import List
+import os
+from typing import Dict, Iterator, List
 
 
 def read_states_file(states_file_path: str) -> List[str]:
@@ -12,3 +13,46 @@ def read_states_file(states_file_path: str) -> List[str]:
             if "#" not in l[0:1] and l != ""]       # Read all non-comment and
                                                     # non-empty lines.
     return states 
+
+
+def collect_volumes(input_paths: List[str]) -> Dict[str, str]:
+    """Map volume names to the analyser output files of a case.
+
+    Every input is either an analyser output file or a case directory, in
+    which case every file directly inside it is taken as the output of a
+    separate volume. The volume name is the file name without extension,
+    suffixed with a number when it is not unique.
+
+    :param input_paths: list of input files and/or case directories
+    :return: a dict with the volume names and their input file paths
+    """
+    files = []
+    for input_path in input_paths:
+        if os.path.isdir(input_path):
+            files += sorted(
+                os.path.join(input_path, f) for f in os.listdir(input_path)
+                if os.path.isfile(os.path.join(input_path, f)))
+        else:
+            files.append(input_path)
+
+    volumes = {}
+    for file in files:
+        name = os.path.splitext(os.path.basename(file))[0]
+        volume, suffix = name, 1
+        while volume in volumes:
+            suffix += 1
+            volume = f"{name}-{suffix}"
+        volumes.update({volume: file})
+    return volumes
+
+
+def consume(items: List) -> Iterator:
+    """Iterate over a list while emptying it, so every item can be freed
+    as soon as it has been processed.
+
+    :param items: the list to consume
+    :return: an iterator over the items, in order
+    """
+    items.reverse()
+    while items:
+        yield items.pop()
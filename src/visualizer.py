@@ -1,9 +1,16 @@
+import json
+import math
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
-from graphviz import Digraph
-from typing import Dict, List
+from graphviz import CalledProcessError, Digraph, ExecutableNotFound
+from typing import Dict, List, Optional, Tuple
 
 from src.config import Config
-from src.tree import Tree
+from src.tree import Node, Tree
 
 NODE_TABLE_START: str = '<<TABLE border="0" cellborder="1" cellspacing="0">'
 NODE_TABLE_END: str = '</TABLE>>'
@@ -15,6 +22,159 @@ FORGERY_ROW_START: str = '<TR><TD bgcolor="red"><font color="white">'
 ROW_END: str = '</font></TD></TR>'
 UNKNOWN_STATE: str = '<<font color="black" point-size="50"><b>?</b></font>>'
 
+RASTER_FORMATS: Tuple[str, ...] = ("png", "jpg", "jpeg", "gif", "bmp")
+BYTES_PER_PIXEL: int = 4        # cairo renders in 32-bit RGBA
+POINTS_PER_INCH: int = 72
+MIN_DPI: int = 72               # below this a capped render is unreadable
+BOUNDING_BOX_REGEX = re.compile(
+    r'bb="([-0-9.e]+),([-0-9.e]+),([-0-9.e]+),([-0-9.e]+)"')
+
+# A statement of a layout, up to its semicolon. Quoted strings and HTML
+# labels (of which the tags cannot contain angle brackets) are matched as a
+# whole, so the brackets and semicolons in them do not end a statement.
+QUOTED = r'"(?:[^"\\]|\\.)*"'
+HTML = r'<(?:[^<>]+|<[^<>]*>)*>'
+LAYOUT_STATEMENT_REGEX = re.compile(
+    rf'(?:{QUOTED}|{HTML}|\[(?:{QUOTED}|{HTML}|[^\]"<]+)*\]|[^;"<\[\]]+)+;?')
+QUOTED_REGEX = re.compile(QUOTED)
+POS_REGEX = re.compile(r'[\[,]\s*pos="((?:[^"\\]|\\.)*)"')
+WIDTH_REGEX = re.compile(r'[\[,]\s*width="?([-0-9.e+]+)')
+HEIGHT_REGEX = re.compile(r'[\[,]\s*height="?([-0-9.e+]+)')
+POINT_REGEX = re.compile(
+    r'(-?[0-9.]+(?:e[-+]?[0-9]+)?),(-?[0-9.]+(?:e[-+]?[0-9]+)?)')
+# Added around the bounds of a statement for pen widths and arrowheads
+TILE_MARGIN: float = 10
+
+# Layout attributes based on the size of the graph. Merging edges
+# (concentrate) and routing splines take most of the layout time of large
+# graphs, limiting the network simplex (nslimit) and crossing minimization
+# (mclimit) iterations keeps the layout time close to linear.
+CONCENTRATE_MAX_EDGES: int = 2000
+FAST_LAYOUT_MIN_NODES: int = 10000
+FAST_LAYOUT_ATTRS: Dict[str, str] = {
+    "splines": "line",
+    "nslimit": "2",
+    "mclimit": "0.5"
+}
+# Used when the layout did not finish within the render timeout, the
+# simplified layout gets a render timeout of its own
+FALLBACK_LAYOUT_ATTRS: Dict[str, str] = {
+    "concentrate": "false",
+    "splines": "false",
+    "nslimit": "0.5",
+    "nslimit1": "0.5",
+    "mclimit": "0.1",
+    "searchsize": "10",
+    "remincross": "false"
+}
+
+
+class RenderTimeoutException(Exception):
+    """Custom exception for renders that did not finish within the render
+    timeout."""
+    pass
+
+
+def _node_name(endpoint: str) -> str:
+    # the name of a node statement or edge endpoint, without its port
+    endpoint = endpoint.strip()
+    if endpoint.startswith('"'):
+        return QUOTED_REGEX.match(endpoint).group()
+    return endpoint.split(":")[0].strip()
+
+
+class TiledLayout:
+    """Graphviz layout split in its statements, to create the layout of a
+    single tile with only the statements drawn on that tile. Every tile is
+    drawn by its own Graphviz process, which then reads only that part of
+    the layout instead of all of it.
+    """
+    header: str
+    footer: str
+    statements: List[str]
+    common: List[int]
+    items: List[Tuple[float, float, float, float, Tuple[int, ...]]]
+
+    def __init__(self, layout: str):
+        body_start = layout.index("{") + 1
+        body_end = layout.rindex("}")
+        self.header = f"{layout[:body_start]}\n"
+        self.footer = layout[body_end:]
+
+        self.statements = [match.group().strip() for match in
+            LAYOUT_STATEMENT_REGEX.finditer(layout, body_start, body_end)
+            if not match.group().isspace()]
+
+        # statements without a position (the graph, node and edge
+        # attributes) are part of every tile, an edge is drawn together
+        # with its nodes
+        self.common = []
+        self.items = []
+        nodes = {}
+        edges = []
+        for num, statement in enumerate(self.statements):
+            pos = POS_REGEX.search(statement)
+            if not pos:
+                self.common.append(num)
+                continue
+            points = [(float(x), float(y)) for x, y in
+                POINT_REGEX.findall(pos.group(1).replace("\\\n", ""))]
+            head = statement.split("[")[0]
+            if "->" in head:
+                edges.append((num, head, points))
+                continue
+            width = WIDTH_REGEX.search(statement)
+            height = HEIGHT_REGEX.search(statement)
+            dx = float(width.group(1)) * POINTS_PER_INCH / 2 if width else 0
+            dy = float(height.group(1)) * POINTS_PER_INCH / 2 if height else 0
+            x, y = points[0]
+            nodes[_node_name(head)] = num
+            self.items.append((x - dx, y - dy, x + dx, y + dy, (num,)))
+        for num, head, points in edges:
+            endpoints = tuple(nodes[name]
+                for name in map(_node_name, head.split("->")) if name in nodes)
+            xs = [x for x, _ in points]
+            ys = [y for _, y in points]
+            self.items.append((min(xs), min(ys), max(xs), max(ys),
+                endpoints + (num,)))
+
+    def tiles(self, left: float, top: float, size: float, rows: int,
+            cols: int) -> Dict[Tuple[int, int], List[int]]:
+        """Find the statements drawn on every tile of a grid.
+
+        :param left: the x coordinate of the left edge of the grid
+        :param top: the y coordinate of the top edge of the grid
+        :param size: the width and height of a tile in points
+        :param rows: the number of rows of the grid
+        :param cols: the number of columns of the grid
+        :return: the statement numbers of every (row, col) tile that is
+            not empty
+        """
+        tiles = {}
+        for x0, y0, x1, y1, statements in self.items:
+            first_col = max(0,
+                math.floor((x0 - TILE_MARGIN - left) / size))
+            last_col = min(cols - 1,
+                math.floor((x1 + TILE_MARGIN - left) / size))
+            first_row = max(0,
+                math.floor((top - y1 - TILE_MARGIN) / size))
+            last_row = min(rows - 1,
+                math.floor((top - y0 + TILE_MARGIN) / size))
+            for row in range(first_row, last_row + 1):
+                for col in range(first_col, last_col + 1):
+                    tiles.setdefault((row, col), set()).update(statements)
+        return {tile: sorted(statements)
+            for tile, statements in tiles.items()}
+
+    def layout(self, statements: List[int] = []) -> str:
+        """Create a layout of the common statements and the given ones.
+
+        :param statements: the statement numbers to include
+        :return: the layout
+        """
+        return self.header + "".join(f"\t{self.statements[num]}\n"
+            for num in self.common + statements) + self.footer
+
 
 class Visualizer:
     trees: Dict[str, Tree]
@@ -23,10 +183,24 @@ class Visualizer:
     output_path: str
     output_file: str
     forgery_states: List[str]
+    relations: List[Tuple[Node, Node]]
+    out_formats: List[str]
+    dpi: float
+    raster_budget: int
+    tiles: bool
+    tile_size: int
+    tile_jobs: int
+    jobs: int
+    render_timeout: Optional[float]
 
     def __init__(self, trees, out_format: str, horizontal_sep: str,
             vertical_sep: str, dpi: str, output_path: str, output_file: str,
-            forgery_states: List[str] = []):
+            forgery_states: List[str] = [],
+            relations: List[Tuple[Node, Node]] = [],
+            raster_budget: int = 1024 * 2 ** 20, tiles: bool = False,
+            tile_size: int = 1024, tile_jobs: int = 1, jobs: int = 1,
+            render_timeout: Optional[float] = None,
+            out_formats: List[str] = None):
         self.trees = trees
         self.graph = Digraph("output", format=out_format,
             node_attr={"shape": "plaintext"},
@@ -42,6 +216,16 @@ class Visualizer:
         self.output_path = output_path
         self.output_file = output_file
         self.forgery_states = forgery_states
+        self.relations = relations
+        self.out_formats = out_formats or [out_format]
+        self.dpi = float(dpi)
+        self.raster_budget = raster_budget
+        self.tiles = tiles
+        self.tile_size = tile_size
+        self.tile_jobs = tile_jobs
+        self.jobs = jobs
+        self.render_timeout = render_timeout
+        self._deadline = None
 
     def _visualize_root(self, root, file):
         root_str = NODE_TABLE_START
@@ -112,11 +296,210 @@ class Visualizer:
                         current_node)
                     self.graph.edge(unknown_id, f"{current_node.id}:header")
 
+    def _visualize_relations(self):
+        # relate operations across volumes without affecting the layout
+        for node, other_node in self.relations:
+            self.graph.edge(f"{other_node.id}:header", f"{node.id}:header",
+                style="dashed", dir="none", constraint="false")
+
+    @staticmethod
+    def _bounding_box(layout: str) -> Tuple[float, float, float, float]:
+        return tuple(float(c)
+            for c in BOUNDING_BOX_REGEX.search(layout).groups())
+
+    def _start_deadline(self):
+        if self.render_timeout is None:
+            self._deadline = None
+        else:
+            self._deadline = time.monotonic() + self.render_timeout
+
+    def _pipe(self, source: str, out_format: str, engine: str = "dot",
+            args: List[str] = []) -> bytes:
+        """Run Graphviz on a source, killing it when the deadline of the
+        render passes. Errors include the error output of Graphviz.
+        """
+        cmd = [engine, f"-T{out_format}"] + args
+        timeout = None
+        if self._deadline is not None:
+            timeout = self._deadline - time.monotonic()
+            if timeout <= 0:
+                raise subprocess.TimeoutExpired(cmd, self.render_timeout)
+        try:
+            return subprocess.run(cmd, input=source.encode(),
+                capture_output=True, check=True, timeout=timeout).stdout
+        except FileNotFoundError as e:
+            raise ExecutableNotFound(cmd) from e
+        except subprocess.CalledProcessError as e:
+            # include the error message of Graphviz, which is captured
+            raise CalledProcessError(e.returncode, e.cmd, output=e.stdout,
+                stderr=e.stderr) from e
+
+    def _render_layout(self, layout: str, out_format: str,
+            graph_attrs: Dict[str, str]) -> bytes:
+        # Graph attributes set at the end of the graph override the ones of
+        # the layout, neato -n2 draws the layout without changing positions
+        attrs = ", ".join(f'{k}="{v}"' for k, v in graph_attrs.items())
+        end = layout.rindex("}")
+        layout = f"{layout[:end]}\tgraph [{attrs}];\n{layout[end:]}"
+        return self._pipe(layout, out_format, engine="neato", args=["-n2"])
+
+    def _write(self, file: str, data: bytes):
+        path = os.path.join(self.output_path, file)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _render_tiles(self, layout: str, out_format: str):
+        """Render the layout as a pyramid of fixed-size tiles, in which
+        every level is zoomed out by a factor of two compared to the next,
+        up to level 0 which fits in a single tile. Every tile is drawn from
+        only the part of the layout on it, and at most tile_jobs tiles are
+        drawn at the same time.
+        """
+        x0, y0, x1, y1 = self._bounding_box(layout)
+        scale = self.dpi / POINTS_PER_INCH
+        width, height = (x1 - x0) * scale, (y1 - y0) * scale
+        max_level = max(0, math.ceil(
+            math.log2(max(width, height, 1) / self.tile_size)))
+        tile_points = self.tile_size / scale    # tile size on the drawing
+        tiles_dir = f"{self.output_file}_tiles"
+        if len(self.out_formats) > 1:
+            tiles_dir += f"_{out_format}"
+        tiled_layout = TiledLayout(layout)
+
+        def render_tile(level: int, row: int, col: int,
+                statements: List[int]):
+            zoom = 2 ** (level - max_level)
+            center_x = x0 + (col + 0.5) * tile_points / zoom
+            center_y = y1 - (row + 0.5) * tile_points / zoom
+            self._write(
+                os.path.join(tiles_dir, str(level),
+                    f"{row}_{col}.{out_format}"),
+                self._render_layout(tiled_layout.layout(statements),
+                    out_format, {
+                        "dpi": f"{self.dpi:g}",
+                        "pad": 0,
+                        "viewport": f"{tile_points},{tile_points}," \
+                            f"{zoom},{center_x},{center_y}"
+                    }))
+
+        levels = []
+        with ThreadPoolExecutor(max_workers=self.tile_jobs) as executor:
+            for level in range(max_level + 1):
+                zoom = 2 ** (level - max_level)
+                rows = math.ceil(height * zoom / self.tile_size)
+                cols = math.ceil(width * zoom / self.tile_size)
+                levels.append({"level": level, "rows": rows, "cols": cols})
+                # the statements of one level at a time are kept in memory
+                tiles = tiled_layout.tiles(x0, y1, tile_points / zoom, rows,
+                    cols)
+                futures = [executor.submit(render_tile, level, row, col,
+                        tiles.get((row, col), []))
+                    for row in range(rows) for col in range(cols)]
+                for future in futures:
+                    future.result()
+
+        self._write(os.path.join(tiles_dir, "tiles.json"), json.dumps({
+            "width": math.ceil(width),
+            "height": math.ceil(height),
+            "tile_size": self.tile_size,
+            "format": out_format,
+            "levels": levels
+        }, indent=4).encode())
+        print(f"rendered {sum(l['rows'] * l['cols'] for l in levels)} " \
+            f"tiles in {len(levels)} levels to " \
+            f"{os.path.join(self.output_path, tiles_dir)}")
+
+    def _render_raster(self, layout: str, out_format: str):
+        """Render a bitmap, capping its predicted size to the raster
+        budget by lowering the DPI, or by switching to tiles when the DPI
+        would become too low.
+        """
+        x0, y0, x1, y1 = self._bounding_box(layout)
+        pixels = (x1 - x0) * (y1 - y0) * \
+            (self.dpi / POINTS_PER_INCH) ** 2
+        max_pixels = self.raster_budget / BYTES_PER_PIXEL
+
+        dpi = self.dpi
+        if pixels > max_pixels:
+            dpi = math.floor(self.dpi * math.sqrt(max_pixels / pixels))
+        if self.tiles or dpi < MIN_DPI:
+            self._render_tiles(layout, out_format)
+            return
+        if dpi != self.dpi:
+            print(f"lowering DPI from {self.dpi:g} to {dpi} to stay within " \
+                f"the raster budget of {self.raster_budget // 2 ** 20} MB")
+        self._write(f"{self.output_file}.{out_format}",
+            self._render_layout(layout, out_format, {"dpi": dpi}))
+
+    def _select_layout(self):
+        """Choose the layout attributes based on the size of the graph."""
+        edges = sum(" -> " in line for line in self.graph.body)
+        nodes = len(self.graph.body) - edges
+        if edges > CONCENTRATE_MAX_EDGES:
+            self.graph.graph_attr["concentrate"] = "false"
+        if nodes > FAST_LAYOUT_MIN_NODES:
+            self.graph.graph_attr.update(FAST_LAYOUT_ATTRS)
+        if edges > CONCENTRATE_MAX_EDGES or nodes > FAST_LAYOUT_MIN_NODES:
+            print(f"large graph ({nodes} nodes, {edges} edges), using a " \
+                "faster layout")
+
+    def _render_format(self, layout: str, out_format: str):
+        if out_format in RASTER_FORMATS:
+            self._render_raster(layout, out_format)
+        else:
+            self._write(f"{self.output_file}.{out_format}",
+                self._render_layout(layout, out_format, {}))
+
+    def _lay_out(self, out_format: str) -> bytes:
+        """Lay out the graph, again with a simplified layout when it does
+        not finish within the render timeout. Every layout starts a new
+        deadline, which the drawings from it share.
+        """
+        self._start_deadline()
+        try:
+            return self._pipe(self.graph.source, out_format)
+        except subprocess.TimeoutExpired:
+            print(f"laying out took longer than {self.render_timeout:g} " \
+                "seconds, laying out again with a simplified layout")
+        self.graph.graph_attr.update(FALLBACK_LAYOUT_ATTRS)
+        self._start_deadline()
+        try:
+            return self._pipe(self.graph.source, out_format)
+        except subprocess.TimeoutExpired as e:
+            raise RenderTimeoutException("the simplified layout also took " \
+                f"longer than {self.render_timeout:g} seconds, increase " \
+                "--render-timeout or visualize fewer files") from e
+
+    def _render(self):
+        """Lay out the graph once and draw every output format from that
+        layout, concurrently.
+        """
+        if len(self.out_formats) == 1 and \
+                self.out_formats[0] not in RASTER_FORMATS:
+            # a single vector format does not need a separate layout pass
+            self._write(f"{self.output_file}.{self.out_formats[0]}",
+                self._lay_out(self.out_formats[0]))
+            return
+
+        layout = self._lay_out("xdot").decode()
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self._render_format, layout, f)
+                    for f in self.out_formats]
+                for future in futures:
+                    future.result()
+        except subprocess.TimeoutExpired as e:
+            # a simplified layout would not make the drawing faster
+            raise RenderTimeoutException("drawing took longer than " \
+                f"{self.render_timeout:g} seconds, increase " \
+                "--render-timeout, lower the DPI or use --tiles") from e
+
     def visualize(self):
         for file, tree in self.trees.items():
             self._visualize_file(file, tree)
+        self._visualize_relations()
+        self._select_layout()
         #self.graph.view(filename=self.output_file, directory=self.output_path,
         # cleanup=True)
-        self.graph.render(filename=self.output_file, directory=self.output_path,
-            cleanup=True)
-            
\ No newline at end of file
+        self._render()
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from src.batch import Batch, BatchException
+
+
+class TestBatch:
+
+    @pytest.fixture
+    def script(self, tmp_path):
+        script = tmp_path / "script.py"
+        script.write_text(
+            "import sys\n"
+            "print(sys.argv[1:])\n"
+            "sys.exit(1 if 'fail' in sys.argv else 0)\n")
+        return str(script)
+
+    def write_manifest(self, tmp_path, jobs):
+        manifest_path = tmp_path / "manifest.json"
+        manifest_path.write_text(json.dumps({"jobs": jobs}))
+        return str(manifest_path)
+
+    def test_run_batch(self, tmp_path, script):
+        manifest_path = self.write_manifest(tmp_path, [
+            {"name": "a", "args": ["input-a"], "memory": 100},
+            {"args": ["fail"], "memory": 100},
+        ])
+        assert Batch(manifest_path, script, cpus=2, memory=150).run() == 1
+
+        with open(manifest_path) as f:
+            jobs = json.load(f)["jobs"]
+        assert [job["status"] for job in jobs] == ["done", "failed"]
+        assert jobs[1]["name"] == "1"
+        with open(jobs[0]["log"]) as f:
+            assert "'--jobs', '1', '--memory-budget', '100', 'input-a'" \
+                in f.read()
+
+    def test_skip_completed(self, tmp_path, script):
+        manifest_path = self.write_manifest(tmp_path, [
+            {"name": "a", "args": ["input-a"], "status": "done"},
+            {"name": "b", "args": ["input-b"], "status": "failed"},
+        ])
+        Batch(manifest_path, script).run()
+        with open(manifest_path) as f:
+            jobs = json.load(f)["jobs"]
+        assert "log" not in jobs[0]
+        assert jobs[1]["status"] == "done"
+
+    def test_invalid_manifest(self, tmp_path, script):
+        manifest_path = self.write_manifest(tmp_path, [
+            {"name": "a", "args": []}, {"name": "a", "args": []}])
+        with pytest.raises(BatchException):
+            Batch(manifest_path, script)
+
+    def test_command_options(self, tmp_path, script):
+        manifest_path = self.write_manifest(tmp_path, [
+            {"name": "a", "args": ["input-a"], "cpus": 2},
+            {"name": "b", "args": ["--jobs=4", "--memory-budget", "50",
+                "input-b"], "memory": 100}
+        ])
+        batch = Batch(manifest_path, script)
+        [first, second] = batch.manifest["jobs"]
+        assert batch._command(first)[2:] == ["--jobs", "2", "input-a"]
+        assert batch._command(second)[2:] == \
+            ["--jobs=4", "--memory-budget", "50", "input-b"]
+
+    def test_job_not_an_object(self, tmp_path, script):
+        manifest_path = self.write_manifest(tmp_path, [["input-a"]])
+        with pytest.raises(BatchException, match="Job 0"):
+            Batch(manifest_path, script)
+
+    @pytest.mark.parametrize("manifest", [
+        [{"args": []}],
+        {"jobs": [{"args": [], "cpus": "2"}]},
+        {"jobs": [{"args": [], "memory": -1}]},
+        {"jobs": [{"args": [], "cpus": True}]}
+    ])
+    def test_invalid_values(self, tmp_path, script, manifest):
+        manifest_path = tmp_path / "manifest.json"
+        manifest_path.write_text(json.dumps(manifest))
+        with pytest.raises(BatchException):
+            Batch(str(manifest_path), script)
+
+    def test_stop_running_jobs(self, tmp_path, script, monkeypatch):
+        manifest_path = self.write_manifest(tmp_path, [
+            {"name": "a", "args": ["input-a"]},
+            {"name": "b", "args": ["input-b"]}
+        ])
+        batch = Batch(manifest_path, script, cpus=1)
+
+        def fail(*args):
+            raise RuntimeError("failed")
+
+        # the batch fails while job a is running
+        monkeypatch.setattr(batch, "_fits", lambda job, running:
+            not running or fail())
+        with pytest.raises(RuntimeError):
+            batch.run()
+        with open(manifest_path) as f:
+            jobs = json.load(f)["jobs"]
+        assert jobs[0]["status"] == "interrupted"
+        assert "status" not in jobs[1]
@@ -0,0 +1,92 @@
+from src.follow import Follower, follow, output_name
+from src.parser import Parser
+from src.tree import update_trees
+
+
+class TestFollower:
+
+    def test_read_appended_lines(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"0 first\r\n1 sec")
+        follower = Follower(str(input_path))
+        assert follower.read_lines() == ["0 first"]
+        with open(input_path, "ab") as f:
+            f.write(b"ond\n2 third\n")
+        assert follower.read_lines() == ["1 second", "2 third"]
+        assert follower.line_number == 1
+        assert follower.read_lines() == []
+
+    def test_last_line(self, tmp_path):
+        # the last line of the analyser does not end with a newline, it is
+        # returned once the file stops growing
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"0 first\n1 last)  ")
+        follower = Follower(str(input_path))
+        assert follower.read_lines() == ["0 first"]
+        assert follower.read_lines() == ["1 last)  "]
+        assert follower.line_number == 1
+        assert follower.read_lines() == []
+        # a newline completes the returned line without returning it again
+        with open(input_path, "ab") as f:
+            f.write(b"\n2 next\n")
+        assert follower.read_lines() == ["2 next"]
+        assert follower.line_number == 2
+
+    def test_last_line_continued(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"0 fir")
+        follower = Follower(str(input_path))
+        assert follower.read_lines() == []
+        assert follower.read_lines() == ["0 fir"]
+        with open(input_path, "ab") as f:
+            f.write(b"st\n1 second\n")
+        # the line is returned again now that it is complete
+        assert follower.read_lines() == ["0 first", "1 second"]
+        assert follower.line_number == 0
+
+    def test_truncated_file(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"0 first\n1 second\n")
+        follower = Follower(str(input_path))
+        follower.read_lines()
+        input_path.write_bytes(b"0 new\n")
+        assert follower.read_lines() == ["0 new"]
+
+    def test_follow_line_numbers(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"0 first\n1 second\n2 last")
+        calls = []
+
+        def parse(lines, line_numbers):
+            calls.append((lines, line_numbers))
+            return Parser.parse_lines([f"0 .\\file{len(calls)} " \
+                "(At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)"])
+
+        def render(trees, changed):
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+
+        follow({"C": str(input_path)}, parse, render, poll_interval=0)
+        assert calls == [(["0 first", "1 second"], [0, 1]),
+            (["2 last"], [2])]
+
+    def test_output_name(self):
+        name = output_name("output", "C:.\\Folder\\test2.odt")
+        assert name.startswith("output-C_._Folder_test2.odt-")
+
+
+class TestUpdateTrees:
+
+    def test_update_trees(self):
+        trees = {}
+        lines = Parser.parse_lines([
+            "0 .\\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+            "1 .\\$MFTMirr (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)"
+        ])
+        assert update_trees(trees, lines) == {".\\$MFT", ".\\$MFTMirr"}
+        lines = Parser.parse_lines([
+            "0 .\\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+            "2 .\\$MFTMirr (At 2020-OCTOBER-5 12:1:31.2715742 UTC: Update)"
+        ])
+        assert update_trees(trees, lines) == {".\\$MFTMirr"}
+        assert len(trees[".\\$MFTMirr"].root.children) == 2
@@ -0,0 +1,81 @@
+from src.index import filter_window, timestamp_interval, timestamp_ticks
+
+
+class TestTimestampInterval:
+
+    def test_at_interval(self):
+        start, end = timestamp_interval(
+            "<TIMESTAMP 2020-10-05T12:01:30.2715742 +0000 (At)>")
+        assert start == end == timestamp_ticks("2020-10-05T12:01:30.2715742")
+
+    def test_from_interval(self):
+        start, end = timestamp_interval(
+            "<TIMESTAMP 2020-10-05T12:02:44.2437766 +0000 - 2020-10-05T12:02:44.6067758 +0000 (From)>")
+        assert end - start == 3629992
+
+    def test_reversed_between_interval(self):
+        # the analyser writes some ranges with the later time first
+        start, end = timestamp_interval(
+            "<TIMESTAMP 2020-10-05T12:02:44.6067758 +0000 - 2020-10-05T12:02:08.3062758 +0000 (Between)>")
+        assert start == timestamp_ticks("2020-10-05T12:02:08.3062758")
+        assert end == timestamp_ticks("2020-10-05T12:02:44.6067758")
+
+    def test_after_interval(self):
+        start, end = timestamp_interval(
+            "<TIMESTAMP 2020-10-05T12:02:44.2437766 +0000 (After)>")
+        assert end == float("inf")
+
+    def test_timezone_offset(self):
+        assert timestamp_ticks("2020-10-05T14:00:00.0000000 +0200") == \
+            timestamp_ticks("2020-10-05T12:00:00.0000000 +0000")
+
+
+class TestFilterWindow:
+
+    def test_filter_window(self):
+        lines = [(".\\test.odt", [
+            ("(At ...: Update)", " <- update", 
+                "<TIMESTAMP 2020-10-05T12:03:00.0000000 +0000 (At)>",
+                ["Update"], "normal"),
+            ("(At ...: Create)", " <- update <- create",
+                "<TIMESTAMP 2020-10-05T12:01:00.0000000 +0000 (At)>",
+                ["Create"], "origin")
+        ])]
+        start = timestamp_ticks("2020-10-05T12:02:00.0000000")
+        assert filter_window(lines, start=start) == \
+            [(".\\test.odt", [lines[0][1][0]])]
+        assert filter_window(lines, end=start) == \
+            [(".\\test.odt", [lines[0][1][1]])]
+        assert filter_window(lines, start=start, end=start) == []
+
+    def test_reversed_between(self):
+        lines = [(".\\test.odt", [
+            ("(Between ...: Update)", " <- update",
+                "<TIMESTAMP 2020-10-05T12:02:44.6067758 +0000 - 2020-10-05T12:02:08.3062758 +0000 (Between)>",
+                ["Update"], "normal")
+        ])]
+        assert filter_window(lines,
+            start=timestamp_ticks("2020-10-05T12:02:20.0000000"),
+            end=timestamp_ticks("2020-10-05T12:02:30.0000000")) == lines
+
+    def test_keep_operations_between(self):
+        # the copy is outside the window, but leaving it out would make the
+        # create the direct predecessor of the move
+        lines = [(".\\test.odt", [
+            ("(At ...: Move)", " <- move",
+                "<TIMESTAMP 2020-10-05T12:02:00.0000000 +0000 (At)>",
+                ["Move"], "normal"),
+            ("(At ...: Copy)", " <- move <- copy",
+                "<TIMESTAMP 2020-10-05T12:05:00.0000000 +0000 (At)>",
+                ["Copy"], "normal"),
+            ("(At ...: Create)", " <- move <- copy <- create",
+                "<TIMESTAMP 2020-10-05T12:01:00.0000000 +0000 (At)>",
+                ["Create"], "origin"),
+            ("(At ...: Access)", " <- move <- copy <- create <- access",
+                "<TIMESTAMP 2020-10-05T12:00:00.0000000 +0000 (At)>",
+                ["Access"], "normal")
+        ])]
+        assert filter_window(lines,
+            start=timestamp_ticks("2020-10-05T12:01:00.0000000"),
+            end=timestamp_ticks("2020-10-05T12:03:00.0000000")) == \
+            [(".\\test.odt", lines[0][1][:3])]
@@ -1,7 +1,10 @@
 """ This file contains some basic unit tests to make sure the
 base functionality works correctly.
 """
-from src.parser import Parser
+import pytest
+
+from src.checkpoint import Checkpoint
+from src.parser import OperationCache, Parser, ParserException
 
 
 class TestTimestampParser():
@@ -127,6 +130,10 @@ class TestPathParser:
         actual = Parser.get_file_path(line)
         assert actual == expected
 
+    def test_parse_deleted_file_path(self):
+        line = "42 test.odt~RF135fbc6.TMP (After 2020-OCTOBER-5 12:2:37.4607316 UTC: Delete)"
+        assert Parser.get_file_path(line) == "test.odt~RF135fbc6.TMP"
+
 
 class TestParseLine:
 
@@ -276,4 +283,112 @@ class TestParseLines:
         ]
         actual = Parser.parse_lines(lines, filter=".\\Folder\test2.odt",
             origin_states=["Create", "Create with file tunneling"])
-        assert actual == expected      
\ No newline at end of file
+        assert actual == expected      
+
+
+class TestMalformedLines:
+
+    lines = [
+        "0 .\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+        "1 .\$MFTMirr truncated output",
+        "2 .\$LogFile (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)"
+    ]
+
+    def test_malformed_path(self):
+        with pytest.raises(ParserException):
+            Parser.get_file_path(self.lines[1])
+
+    def test_malformed_line_raises(self):
+        with pytest.raises(ParserException, match="Line 1"):
+            Parser.parse_lines(self.lines)
+
+    def test_quarantine(self):
+        quarantine = []
+        actual = Parser.parse_lines(self.lines, quarantine=quarantine)
+        assert [line[0] for line in actual] == [".\$MFT", ".\$LogFile"]
+        assert [(num, line) for num, line, _ in quarantine] == \
+            [(1, self.lines[1])]
+
+
+class TestCheckpoint:
+
+    lines = [
+        f"{i} .\\file{i}.txt (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)"
+        for i in range(5)
+    ] + ["5 malformed"]
+
+    def test_resume(self, tmp_path):
+        expected = Parser.parse_lines(self.lines, quarantine=[])
+
+        checkpoint = Checkpoint(str(tmp_path / "volume"), interval=2)
+        Parser.parse_lines(self.lines[:3], quarantine=[],
+            checkpoint=checkpoint)
+        assert checkpoint.load("parse")[0] == 3
+
+        # lines before the checkpoint are not parsed again
+        lines = ["malformed"] * 3 + self.lines[3:]
+        quarantine = []
+        actual = Parser.parse_lines(lines, quarantine=quarantine,
+            checkpoint=checkpoint)
+        assert actual == expected
+        assert [num for num, _, _ in quarantine] == [5]
+
+    def test_incomplete_record(self, tmp_path):
+        checkpoint = Checkpoint(str(tmp_path / "volume"))
+        checkpoint.append("parse", 2, ["a", "b"])
+        checkpoint.append("parse", 4, ["c", "d"])
+        with open(tmp_path / "volume" / "parse.pickle", "r+b") as f:
+            f.truncate(f.seek(0, 2) - 3)
+        assert checkpoint.load("parse") == (2, [["a", "b"]])
+        checkpoint.append("parse", 3, ["c"])
+        assert checkpoint.load("parse") == (3, [["a", "b"], ["c"]])
+        checkpoint.clear()
+        assert not (tmp_path / "volume").exists()
+
+    def test_fingerprint(self, tmp_path):
+        fingerprint = {"input": "case.txt", "size": 100, "filter": ""}
+        checkpoint = Checkpoint(str(tmp_path / "volume"),
+            fingerprint=fingerprint)
+        assert checkpoint.matches()
+        checkpoint.append("parse", 2, ["a", "b"])
+        assert Checkpoint(str(tmp_path / "volume"),
+            fingerprint=dict(fingerprint)).matches()
+        assert not Checkpoint(str(tmp_path / "volume"),
+            fingerprint=dict(fingerprint, size=200)).matches()
+        checkpoint.clear()
+        assert not (tmp_path / "volume").exists()
+
+
+class TestOperationCache:
+
+    def test_cached_parse_lines(self):
+        lines = [
+            "0 .\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+            "1 .\$MFTMirr (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+            "2 .\$LogFile (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)"
+        ]
+        cache = OperationCache()
+        expected = Parser.parse_lines(lines, origin_states=["Create"])
+        actual = Parser.parse_lines(lines, origin_states=["Create"],
+            cache=cache)
+        assert actual == expected
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_origin_states_in_key(self):
+        operation = "(At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create | Update)"
+        cache = OperationCache()
+        _, origin, normal = Parser.parse_operation(operation, ["Create"], cache)
+        assert (origin, normal) == (["Create"], ["Update"])
+        _, origin, normal = Parser.parse_operation(operation, [], cache)
+        assert (origin, normal) == ([], ["Create", "Update"])
+        assert cache.hits == 0
+
+    def test_least_recently_used_evicted(self):
+        cache = OperationCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        assert list(cache.entries) == ["a", "c"]
+        assert cache.hit_rate == 1.0
+
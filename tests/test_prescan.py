@@ -0,0 +1,50 @@
+from functools import partial
+
+from src.parser import Parser
+from src.prescan import find_suspicious_paths, prescan_file, select_lines
+
+DATA = (
+    b"0 .\\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)\r\n"
+    b"5 . (At 2020-OCTOBER-5 12:3:31.4338850 UTC: Update directory)\n"
+    b"40 .\\test2.odt (At 2020-OCTOBER-5 12:2:44.6067758 UTC: Update)\n"
+    b"41 .\\test2.odt (At 2020-OCTOBER-5 12:2:44.6067758 UTC: Use of a time-stamp change tool)\n"
+    b"42 .\\Folder\\test2.odt (At 2020-OCTOBER-5 12:2:44.6067758 UTC: Update)\n"
+    b"43 . (At 2020-OCTOBER-5 12:3:31.4338850 UTC: Use of a time-stamp change tool)"
+)
+FORGERY_STATES = ["Use of a time-stamp change tool"]
+
+
+class TestPrescan:
+
+    def test_find_suspicious_paths(self):
+        assert find_suspicious_paths(DATA, FORGERY_STATES) == {".\\test2.odt", ""}
+
+    def test_select_lines(self):
+        selected = select_lines(DATA, {".\\test2.odt", ""})
+        assert [num for num, _ in selected] == [1, 2, 3, 5]
+        assert [line.split(" ")[0] for _, line in selected] == \
+            ["5", "40", "41", "43"]
+
+    def test_prescan_file(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(DATA)
+        lines, line_numbers = prescan_file(str(input_path), FORGERY_STATES)
+        assert len(lines) == 4
+        assert line_numbers == [1, 2, 3, 5]
+        assert not any(line.endswith(("\r", "\n")) for line in lines)
+
+    def test_quarantine_line_numbers(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(DATA + b"\n44 .\\test2.odt (At " \
+            b"2020-OCTOBER-5 99:99:99.0 UTC: Use of a time-stamp change tool)")
+        quarantine_path = tmp_path / "quarantine.txt"
+        Parser.parse_file(str(input_path),
+            quarantine_path=str(quarantine_path),
+            reader=partial(prescan_file, forgery_states=FORGERY_STATES))
+        # the line number in the input, not in the prescanned lines
+        assert quarantine_path.read_text().startswith("# Line 6:")
+
+    def test_prescan_empty_file(self, tmp_path):
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"")
+        assert prescan_file(str(input_path), FORGERY_STATES) == ([], [])
@@ -0,0 +1,51 @@
+from src.parser import Parser
+from src.stats import case_stats, format_ticks
+from src.tree import TreeStore, generate_trees
+from src.utils import read_states_file
+
+
+class TestStats:
+
+    lines = [
+        "0 .\\$MFT (At 2020-OCTOBER-5 12:1:30.2715742 UTC: Create)",
+        "40 .\\Folder\\test2.odt (From 2020-OCTOBER-5 12:2:44.2437766 UTC to 2020-OCTOBER-5 12:2:44.6067758 UTC: Use of a time-stamp change tool) <- (At 2020-OCTOBER-5 12:2:37.4497311 UTC: Create | Update)",
+        "41 .\\Folder\\test2.odt (At 2020-OCTOBER-5 12:2:50.0000000 UTC: Update) <- (At 2020-OCTOBER-5 12:2:37.4497311 UTC: Create | Update)"
+    ]
+
+    def test_case_stats(self):
+        trees = generate_trees(Parser.parse_lines(self.lines,
+            origin_states=["Create"]))
+        report = case_stats(trees, ["Use of a time-stamp change tool"])
+        assert [stats["file"] for stats in report] == \
+            [".\\Folder\\test2.odt", ".\\$MFT"]
+
+        stats = report[0]
+        assert stats["rank"] == 1
+        assert stats["forgery_actions"] == 1
+        assert stats["histories"] == 2
+        assert stats["nodes"] == 6
+        assert stats["depth"] == 2
+        assert stats["width"] == 4
+        assert stats["origin_actions"] == 2
+        assert stats["first"] == "2020-10-05T12:02:37.4497311Z"
+        assert stats["last"] == "2020-10-05T12:02:50.0000000Z"
+
+    def test_histories(self, tmp_path):
+        # an operation with both origin and normal actions is one history
+        lines = Parser.parse_file(
+            "samples/forgery/sample-input-with-forgery.txt",
+            origin_states=read_states_file("origin-states.txt"))
+        expected = {".\\Folder\\test2.odt": 96, "": 4}
+        histories = {stats["file"]: stats["histories"]
+            for stats in case_stats(generate_trees(lines))}
+        assert {file: histories[file] for file in expected} == expected
+
+        store = TreeStore(str(tmp_path / "trees.sqlite"), memory_budget=1)
+        histories = {stats["file"]: stats["histories"]
+            for stats in case_stats(generate_trees(lines, store=store))}
+        assert {file: histories[file] for file in expected} == expected
+        store.close(remove=True)
+
+    def test_format_ticks(self):
+        assert format_ticks(16018992902715742) == \
+            "2020-10-05T12:01:30.2715742Z"
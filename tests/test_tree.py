@@ -1,6 +1,10 @@
+import tracemalloc
+
 import pytest
 
-from src.tree import Node, Tree
+from src.tree import Node, StoredNodes, StoredTree, Tree, TreeStore, \
+    generate_trees, relate_volumes
+from src.utils import consume
 
 
 class TestNode:
@@ -46,3 +50,187 @@ class TestTree:
         tree.add_node(operation)
         assert len(tree.tree.keys()) == 2
 
+
+
+class TestVolumes:
+
+    def test_generate_namespaced_trees(self):
+        lines = [(".\\Folder\\test2.odt", [(
+            "(At 2020-OCTOBER-5 12:2:37.4497311 UTC: Create)",
+            " <- (At 2020-OCTOBER-5 12:2:37.4497311 UTC: Create)",
+            "<TIMESTAMP 2020-10-05T12:02:37.4497311 +0000 (At)>",
+            ["Create"],
+            "origin"
+        )])]
+        trees = generate_trees(lines, volume="C")
+        trees = generate_trees(lines, volume="D", trees=trees)
+        assert list(trees.keys()) == \
+            ["C:.\\Folder\\test2.odt", "D:.\\Folder\\test2.odt"]
+        assert not set(trees["C:.\\Folder\\test2.odt"].tree) \
+            & set(trees["D:.\\Folder\\test2.odt"].tree)
+
+    def test_relate_volumes(self):
+        operation = (
+            "(At 2020-OCTOBER-5 12:2:8.3062758 UTC: Copy) on other volume",
+            " <- (At 2020-OCTOBER-5 12:2:8.3062758 UTC: Copy) on other volume",
+            "<TIMESTAMP 2020-10-05T12:02:08.3062758 +0000 (At)>",
+            ["Copy, on other volume"],
+            "normal"
+        )
+        other_operation = (
+            "(At 2020-OCTOBER-5 12:2:8.3062758 UTC: Access)",
+            " <- (At 2020-OCTOBER-5 12:2:8.3062758 UTC: Access)",
+            "<TIMESTAMP 2020-10-05T12:02:08.3062758 +0000 (At)>",
+            ["Access"],
+            "normal"
+        )
+        trees = generate_trees([(".\\Copy\\test.odt", [operation])], "C")
+        trees = generate_trees([(".\\test.odt", [other_operation])], "D",
+            trees=trees)
+        relations = relate_volumes(trees)
+        assert len(relations) == 1
+        assert relations[0][0].actions == ["Copy, on other volume"]
+        assert relations[0][1].actions == ["Access"]
+
+    def test_relate_common_file_names(self):
+        operation = (
+            "(At 2020-OCTOBER-5 12:2:8.3062758 UTC: Copy) on other volume",
+            " <- (At 2020-OCTOBER-5 12:2:8.3062758 UTC: Copy) on other volume",
+            "<TIMESTAMP 2020-10-05T12:02:08.3062758 +0000 (At)>",
+            ["Copy, on other volume"],
+            "normal"
+        )
+        files = [".\\A\\desktop.ini", ".\\B\\desktop.ini", ".\\C\\desktop.ini"]
+
+        def lines(files):
+            # a distinct operation path per file, so the nodes are distinct
+            return [(file, [operation[:1] + (operation[1] + file,)
+                + operation[2:]]) for file in files]
+
+        trees = generate_trees(lines(files), "C")
+        trees = generate_trees(lines(files[:2]), "D", trees=trees)
+        relations = relate_volumes(trees)
+        # only the copies with the same relative path are related
+        assert sorted((node.path, other.path) for node, other in relations) \
+            == [(node.path, node.path) for node in sorted(
+                (trees[f"C:{file}"].root.children[0] for file in files[:2]),
+                key=lambda node: node.path)]
+
+
+class TestTreeStore:
+
+    lines = [
+        (".\\test.odt", [
+            ("(At ...: Update)", " <- update",
+                "<TIMESTAMP 2020-10-05T12:03:00.0000000 +0000 (At)>",
+                ["Update"], "normal"),
+            ("(At ...: Create)", " <- update <- create",
+                "<TIMESTAMP 2020-10-05T12:01:00.0000000 +0000 (At)>",
+                ["Create"], "origin")
+        ]),
+        (".\\test.odt", [
+            ("(At ...: Update)", " <- update",
+                "<TIMESTAMP 2020-10-05T12:03:00.0000000 +0000 (At)>",
+                ["Update"], "normal"),
+            ("(At ...: Copy)", " <- update <- copy",
+                "<TIMESTAMP 2020-10-05T12:02:00.0000000 +0000 (At)>",
+                ["Copy"], "normal")
+        ]),
+        (".\\other.odt", [
+            ("(At ...: Create)", " <- create",
+                "<TIMESTAMP 2020-10-05T12:01:00.0000000 +0000 (At)>",
+                ["Create"], "origin")
+        ])
+    ]
+
+    @staticmethod
+    def walk(tree):
+        nodes = [(0, tree.root)]
+        result = []
+        while nodes:
+            depth, node = nodes.pop(0)
+            result.append((depth, node.id, node.actions, node.origin_state))
+            nodes += [(depth + 1, child) for child in node.children]
+        return result
+
+    def test_spill_to_store(self, tmp_path):
+        expected = generate_trees(self.lines)
+        store = TreeStore(str(tmp_path / "trees.sqlite"), memory_budget=1,
+            batch_size=2)
+        actual = generate_trees(self.lines, store=store)
+        assert store.spilled
+        assert all(isinstance(tree, StoredTree) for tree in actual.values())
+        assert list(actual) == list(expected)
+        for file in expected:
+            assert self.walk(actual[file]) == self.walk(expected[file])
+            assert len(actual[file].tree) == len(expected[file].tree)
+        store.close(remove=True)
+        assert not (tmp_path / "trees.sqlite").exists()
+
+    def test_within_budget(self, tmp_path):
+        store = TreeStore(str(tmp_path / "trees.sqlite"),
+            memory_budget=2 ** 30)
+        trees = generate_trees(self.lines, store=store)
+        assert not store.spilled
+        assert not any(isinstance(tree, StoredTree) for tree in trees.values())
+
+    def test_relate_stored_volumes(self, tmp_path, monkeypatch):
+        copy = ("(At ...: Copy) on other volume", " <- copy",
+            "<TIMESTAMP 2020-10-05T12:02:08.3062758 +0000 (At)>",
+            ["Copy, on other volume"], "normal")
+        access = ("(At ...: Access)", " <- access",
+            "<TIMESTAMP 2020-10-05T12:02:08.3062758 +0000 (At)>",
+            ["Access"], "normal")
+        volumes = [
+            ("C", [(".\\Copy\\test.odt", [copy])]
+                + [(file, [copy[:1] + (copy[1] + file,) + copy[2:]])
+                    for file in (".\\A\\desktop.ini", ".\\B\\desktop.ini")]),
+            ("D", [(".\\test.odt", [access])]
+                + [(file, [access[:1] + (access[1] + file,) + access[2:]])
+                    for file in (".\\A\\desktop.ini", ".\\C\\desktop.ini")])
+        ]
+
+        def relate(store):
+            trees = {}
+            for volume, lines in volumes:
+                trees = generate_trees(lines, volume, store=store,
+                    trees=trees)
+            return trees, [(node.id, other.id)
+                for node, other in relate_volumes(trees)]
+
+        _, expected = relate(None)
+        assert len(expected) == 2
+        store = TreeStore(str(tmp_path / "trees.sqlite"), memory_budget=1)
+        trees, _ = relate(store)
+        assert all(isinstance(tree, StoredTree) for tree in trees.values())
+        # the related nodes are looked up without loading the trees
+        monkeypatch.setattr(StoredNodes, "values", None)
+        assert [(node.id, other.id)
+            for node, other in relate_volumes(trees)] == expected
+        store.close(remove=True)
+
+    @staticmethod
+    def traced_memory(store):
+        # the lines are created and consumed while tracing, so only the
+        # memory still held by the trees is counted
+        tracemalloc.start()
+        try:
+            lines = [(f".\\file{num % 20}.odt", [(
+                "(At ...: Update)", f" <- update {num} " + "x" * 200,
+                "<TIMESTAMP 2020-10-05T12:03:00.0000000 +0000 (At)>",
+                ["Update"], "origin")]) for num in range(2000)]
+            trees = generate_trees(consume(lines), store=store)
+            assert not lines
+            memory = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return trees, memory
+
+    def test_spill_frees_memory(self, tmp_path):
+        _, in_memory = self.traced_memory(None)
+        store = TreeStore(str(tmp_path / "trees.sqlite"),
+            memory_budget=2 ** 16, batch_size=100)
+        trees, spilled = self.traced_memory(store)
+        assert store.spilled and len(trees) == 20
+        assert spilled < in_memory / 10
+        store.close(remove=True)
@@ -0,0 +1,245 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.visualizer import CONCENTRATE_MAX_EDGES, FAST_LAYOUT_MIN_NODES, \
+    RenderTimeoutException, TiledLayout, Visualizer
+
+# Layout of 1440x720 points: nodes a and b top left, with an edge between
+# them, and node c bottom right. The label of a contains the characters that
+# separate statements.
+LAYOUT = """digraph output {
+	graph [bb="0,0,1440,720",
+		concentrate=true,
+		dpi=100,
+		rankdir=LR
+	];
+	node [label="\\N", shape=plaintext];
+	a [height=0.5, label=<<TABLE><TR><TD>a; [b] -&gt; c</TD></TR></TABLE>>, pos="36,684", width=1];
+	b [height=0.5, pos="180,684", width=1];
+	a:header -> b:header [pos="e,144,684 72,684 100,684 120,684 144,684"];
+	c [height=0.5, pos="1404,36", width=1];
+}
+"""
+
+
+class FakeGraphviz:
+    """Replaces Visualizer._pipe, returning LAYOUT for layouts. The calls
+    for the formats in timeouts time out, once per occurrence.
+    """
+
+    def __init__(self, timeouts=()):
+        self.calls = []
+        self.timeouts = list(timeouts)
+
+    def __call__(self, source, out_format, engine="dot", args=[]):
+        self.calls.append((source, out_format, engine))
+        if out_format in self.timeouts:
+            self.timeouts.remove(out_format)
+            raise subprocess.TimeoutExpired(engine, 1)
+        if out_format == "xdot":
+            return LAYOUT.encode()
+        return f"{out_format} image".encode()
+
+    def drawings(self):
+        return [call for call in self.calls if call[1] != "xdot"]
+
+
+def create_visualizer(tmp_path, **kwargs):
+    kwargs.setdefault("out_format", "png")
+    kwargs.setdefault("dpi", "72")
+    vis = Visualizer({}, horizontal_sep="2", vertical_sep="0.5",
+        output_path=str(tmp_path), output_file="output", **kwargs)
+    vis._pipe = FakeGraphviz()
+    return vis
+
+
+class TestTiledLayout:
+
+    def test_statements(self):
+        layout = TiledLayout(LAYOUT)
+        assert len(layout.statements) == 6
+        assert layout.statements[2].startswith("a [")
+        assert [layout.statements[num] for num in layout.common] == \
+            [layout.statements[0], layout.statements[1]]
+
+    def test_tiles(self):
+        layout = TiledLayout(LAYOUT)
+        tiles = layout.tiles(0, 720, 256, rows=3, cols=6)
+        # the edge is drawn with its nodes
+        assert tiles[(0, 0)] == [2, 3, 4]
+        assert tiles[(2, 5)] == [5]
+        assert (1, 2) not in tiles
+        assert layout.tiles(0, 720, 2048, rows=1, cols=1) == \
+            {(0, 0): [2, 3, 4, 5]}
+        source = layout.layout(tiles[(2, 5)])
+        assert source.startswith("digraph output {")
+        assert "c [" in source and "a [" not in source
+        assert source.rstrip().endswith("}")
+
+
+class TestRaster:
+
+    def test_within_budget(self, tmp_path):
+        vis = create_visualizer(tmp_path)
+        vis._render_raster(LAYOUT, "png")
+        [(source, out_format, engine)] = vis._pipe.drawings()
+        assert (out_format, engine) == ("png", "neato")
+        assert 'graph [dpi="72.0"];' in source
+        assert (tmp_path / "output.png").read_bytes() == b"png image"
+
+    def test_lower_dpi(self, tmp_path):
+        # 1440x720 points at 144 DPI is 2880x1440 pixels, a budget of a
+        # quarter of that halves the DPI
+        vis = create_visualizer(tmp_path, dpi="144",
+            raster_budget=1440 * 720 * 4)
+        vis._render_raster(LAYOUT, "png")
+        [(source, _, _)] = vis._pipe.drawings()
+        assert 'graph [dpi="72"];' in source
+        assert not (tmp_path / "output_tiles").exists()
+
+    def test_switch_to_tiles(self, tmp_path):
+        # below 72 DPI the image is tiled instead
+        vis = create_visualizer(tmp_path, dpi="144",
+            raster_budget=1440 * 720, tile_size=256)
+        vis._render_raster(LAYOUT, "png")
+        assert not (tmp_path / "output.png").exists()
+        assert (tmp_path / "output_tiles" / "tiles.json").exists()
+
+
+class TestTiles:
+
+    def test_pyramid(self, tmp_path):
+        vis = create_visualizer(tmp_path, tiles=True, tile_size=256,
+            tile_jobs=2)
+        vis._render_raster(LAYOUT, "png")
+        tiles_dir = tmp_path / "output_tiles"
+        with open(tiles_dir / "tiles.json") as f:
+            tiles = json.load(f)
+        assert tiles == {
+            "width": 1440,
+            "height": 720,
+            "tile_size": 256,
+            "format": "png",
+            "levels": [
+                {"level": 0, "rows": 1, "cols": 1},
+                {"level": 1, "rows": 1, "cols": 2},
+                {"level": 2, "rows": 2, "cols": 3},
+                {"level": 3, "rows": 3, "cols": 6}
+            ]
+        }
+        assert len(vis._pipe.drawings()) == 1 + 2 + 6 + 18
+        for level in tiles["levels"]:
+            for row in range(level["rows"]):
+                for col in range(level["cols"]):
+                    assert (tiles_dir / str(level["level"])
+                        / f"{row}_{col}.png").exists()
+
+    def test_tile_layouts(self, tmp_path):
+        vis = create_visualizer(tmp_path, tiles=True, tile_size=256)
+        vis._render_raster(LAYOUT, "png")
+        viewports = {}
+        for source, _, _ in vis._pipe.drawings():
+            viewport = source.split('viewport="')[1].split('"')[0]
+            viewports[viewport] = source
+        # the top left tile of the last level only has a, b and their edge
+        top_left = viewports["256.0,256.0,1,128.0,592.0"]
+        assert "a [" in top_left and "a:header -> b:header" in top_left
+        assert "c [" not in top_left
+        # the single tile of level 0 has every statement
+        assert "c [" in viewports["256.0,256.0,0.125,1024.0,-304.0"]
+
+
+class TestFormats:
+
+    def test_single_layout(self, tmp_path):
+        vis = create_visualizer(tmp_path, out_formats=["svg", "png", "pdf"])
+        vis.visualize()
+        # the graph is laid out once and every format is drawn from it
+        assert [call[1] for call in vis._pipe.calls].count("xdot") == 1
+        assert sorted(call[1] for call in vis._pipe.drawings()) == \
+            ["pdf", "png", "svg"]
+        assert all(engine == "neato" for _, _, engine in
+            vis._pipe.drawings())
+        for out_format in ("svg", "png", "pdf"):
+            assert (tmp_path / f"output.{out_format}").read_bytes() == \
+                f"{out_format} image".encode()
+
+
+class TestSelectLayout:
+
+    @staticmethod
+    def select(tmp_path, nodes, edges):
+        vis = create_visualizer(tmp_path)
+        vis.graph.body = ["\tn [label=x]\n"] * nodes + \
+            ["\ta -> b\n"] * edges
+        vis._select_layout()
+        return vis.graph.graph_attr
+
+    def test_small_graph(self, tmp_path):
+        attrs = self.select(tmp_path, FAST_LAYOUT_MIN_NODES,
+            CONCENTRATE_MAX_EDGES)
+        assert attrs["concentrate"] == "true"
+        assert "splines" not in attrs
+
+    def test_many_edges(self, tmp_path):
+        attrs = self.select(tmp_path, 10, CONCENTRATE_MAX_EDGES + 1)
+        assert attrs["concentrate"] == "false"
+        assert "splines" not in attrs
+
+    def test_many_nodes(self, tmp_path):
+        attrs = self.select(tmp_path, FAST_LAYOUT_MIN_NODES + 1, 10)
+        assert attrs["concentrate"] == "true"
+        assert attrs["splines"] == "line"
+        assert attrs["nslimit"] == "2"
+
+
+class TestRenderTimeout:
+
+    def test_fallback_layout(self, tmp_path):
+        vis = create_visualizer(tmp_path, render_timeout=1)
+        vis._pipe = FakeGraphviz(timeouts=["xdot"])
+        vis.visualize()
+        [first, second] = [call[0] for call in vis._pipe.calls
+            if call[1] == "xdot"]
+        assert "remincross" not in first
+        assert "remincross=false" in second
+        assert (tmp_path / "output.png").exists()
+
+    def test_fallback_times_out(self, tmp_path):
+        vis = create_visualizer(tmp_path, out_format="svg", render_timeout=1)
+        vis._pipe = FakeGraphviz(timeouts=["svg", "svg"])
+        with pytest.raises(RenderTimeoutException, match="simplified"):
+            vis.visualize()
+        assert len(vis._pipe.calls) == 2
+
+    def test_drawing_times_out(self, tmp_path):
+        # only the drawing timed out, so the layout is not made again
+        vis = create_visualizer(tmp_path, render_timeout=1)
+        vis._pipe = FakeGraphviz(timeouts=["png"])
+        with pytest.raises(RenderTimeoutException, match="drawing"):
+            vis.visualize()
+        assert [call[1] for call in vis._pipe.calls] == ["xdot", "png"]
+
+    def test_shared_deadline(self, tmp_path):
+        # a Graphviz process is not started when the deadline has passed
+        vis = Visualizer({}, "png", "2", "0.5", "72", str(tmp_path),
+            "output", render_timeout=60)
+        vis._deadline = time.monotonic() - 1
+        with pytest.raises(subprocess.TimeoutExpired):
+            vis._pipe("digraph {}", "png", engine="no-such-graphviz")
+
+
+class TestPipe:
+
+    def test_error_output(self, tmp_path):
+        vis = create_visualizer(tmp_path)
+        del vis._pipe
+        # the Python interpreter rejects -T like an unknown Graphviz format
+        with pytest.raises(subprocess.CalledProcessError) as e:
+            vis._pipe("", "png", engine=sys.executable)
+        assert b"Unknown option" in e.value.stderr
+        assert "Unknown option" in str(e.value)
@@ -1,10 +1,76 @@
 import json
+import os
+import sys
+from functools import partial
 
+from src.batch import Batch, BatchException
+from src.checkpoint import Checkpoint
 from src.config import Config
-from src.parser import Parser
-from src.tree import generate_trees
-from src.utils import read_states_file
-from src.visualizer import Visualizer
+from src.follow import follow, output_name
+from src.index import filter_window
+from src.parser import OperationCache, Parser
+from src.prescan import prescan_file
+from src.stats import case_stats, write_report
+from src.tree import TreeStore, generate_trees, relate_volumes
+from src.utils import consume, read_states_file
+from src.visualizer import RenderTimeoutException, Visualizer
+
+
+def create_visualizer(config: Config, trees, output_file: str,
+        forgery_states, relations=[]) -> Visualizer:
+    return Visualizer(
+        trees=trees, 
+        out_format=config.out_format,
+        horizontal_sep=config.horizontal_sep,
+        vertical_sep=config.vertical_sep,
+        dpi=config.dpi,
+        output_path = config.output_path,
+        output_file = output_file,
+        forgery_states=forgery_states,
+        relations=relations,
+        raster_budget=config.raster_budget,
+        tiles=config.tiles,
+        tile_size=config.tile_size,
+        tile_jobs=config.tile_jobs,
+        jobs=config.jobs,
+        render_timeout=config.render_timeout,
+        out_formats=config.out_formats
+    )
+
+
+def follow_input(config: Config, origin_states, forgery_states):
+    cache = OperationCache(config.cache_size) if config.cache_size else None
+
+    def parse(lines, line_numbers):
+        quarantine = []
+        parsed_lines = Parser.parse_lines(lines, origin_states=origin_states,
+            filter=config.filter, quarantine=quarantine, cache=cache,
+            line_numbers=line_numbers)
+        if quarantine:
+            Parser.write_quarantine(quarantine,
+                config.quarantine_path("follow"), append=True)
+        return filter_window(parsed_lines, config.window_start,
+            config.window_end)
+
+    def render(trees, changed):
+        if config.stats_format:
+            os.makedirs(config.output_path or ".", exist_ok=True)
+            write_report(case_stats(trees, forgery_states),
+                os.path.join(config.output_path,
+                    f"{config.output_file}-stats.{config.stats_format}"),
+                config.stats_format)
+            return
+        for file in sorted(changed):
+            try:
+                create_visualizer(config, {file: trees[file]},
+                    output_name(config.output_file, file),
+                    forgery_states).visualize()
+            except RenderTimeoutException as e:
+                # keep following, the file is rendered again when it changes
+                print(f"could not render {file}: {e}")
+
+    follow(config.volumes, parse, render, config.poll_interval,
+        namespace=len(config.volumes) > 1)
 
 
 if __name__ == "__main__":
@@ -12,32 +78,103 @@ if __name__ == "__main__":
     print("reading arguments...")
     config = Config()
 
+    if config.batch_manifest:
+        # Run every case of the manifest in its own process
+        print("running batch...")
+        try:
+            failed = Batch(config.batch_manifest, os.path.abspath(__file__),
+                cpus=config.batch_cpus, memory=config.batch_memory).run()
+        except BatchException as e:
+            sys.exit(f"invalid batch manifest: {e}")
+        sys.exit(1 if failed else 0)
+
     # Retrieve origin and forgery states
     print("retrieving origin and forgery states...")
     origin_states = read_states_file(config.origin_states_path)
     forgery_states = read_states_file(config.forgery_states_path)
 
-    # Read and parse input file
+    if config.follow:
+        # Follow the input files, updating and rendering the changed trees
+        print("following input...")
+        follow_input(config, origin_states, forgery_states)
+        sys.exit()
+
+    # Set up checkpoints, discarding those of previous runs unless resuming
+    # a run with the same input and options
+    checkpoints = {}
+    if config.checkpoint_interval:
+        checkpoints = {volume: Checkpoint(
+                os.path.join(config.checkpoint_dir, volume),
+                config.checkpoint_interval,
+                config.fingerprint(volume, origin_states, forgery_states))
+            for volume in config.volumes}
+        for checkpoint in checkpoints.values():
+            if config.resume and checkpoint.matches():
+                print(f"resuming from checkpoint {checkpoint.path}...")
+                continue
+            if config.resume:
+                print(f"checkpoint {checkpoint.path} was made with a " \
+                    "different input or options, starting over...")
+            checkpoint.clear()
+
+    # Read and parse input files, only reading the lines of files with
+    # forgery states when prescanning
     print("reading and parsing input input...")
-    with open(config.input_path) as f:
-        lines = f.readlines()
-    parsed_lines = Parser.parse_lines(lines, origin_states=origin_states,
-        filter=config.filter)
+    reader = None
+    if config.prescan:
+        reader = partial(prescan_file, forgery_states=forgery_states)
+    parsed_volumes = Parser.parse_volumes(config.volumes,
+        origin_states=origin_states, filter=config.filter, jobs=config.jobs,
+        checkpoints=checkpoints,
+        quarantine_paths={volume: config.quarantine_path(volume)
+            for volume in config.volumes},
+        cache_size=config.cache_size, reader=reader)
+    if config.window_start is not None or config.window_end is not None:
+        print("selecting operations in time window...")
+        parsed_volumes = {volume: filter_window(parsed_lines,
+                config.window_start, config.window_end)
+            for volume, parsed_lines in parsed_volumes.items()}
 
-    # Generate file trees
+    # Generate file trees, namespaced by volume when there are multiple, and
+    # moved to disk when they exceed the memory budget. Every parsed line is
+    # released once it has been added, so the memory of the trees is freed
+    # when they are moved. Trees are not checkpointed, when resuming they are
+    # generated again from the parsed lines.
     print("generating trees...")
-    trees = generate_trees(parsed_lines)
+    store = TreeStore(config.tree_store_path, config.memory_budget)
+    store.close(remove=True)
+    relations = []
+    namespace = len(parsed_volumes) > 1
+    trees = {}
+    for volume in list(parsed_volumes):
+        trees = generate_trees(consume(parsed_volumes.pop(volume)),
+            volume=volume if namespace else "", store=store, trees=trees)
+    if namespace and not config.stats_format:
+        relations = relate_volumes(trees)
 
-    # Visualize trees
-    print("Visualizing trees...")
-    vis = Visualizer(
-        trees=trees, 
-        out_format=config.out_format,
-        horizontal_sep=config.horizontal_sep,
-        vertical_sep=config.vertical_sep,
-        dpi=config.dpi,
-        output_path = config.output_path,
-        output_file = config.output_file,
-        forgery_states=forgery_states
-    )
-    vis.visualize() 
\ No newline at end of file
+    if config.stats_format:
+        # Write a triage report instead of visualizing
+        print("writing statistics report...")
+        report_path = os.path.join(config.output_path,
+            f"{config.output_file}-stats.{config.stats_format}")
+        os.makedirs(config.output_path or ".", exist_ok=True)
+        write_report(case_stats(trees, forgery_states), report_path,
+            config.stats_format)
+    else:
+        # Visualize trees
+        print("Visualizing trees...")
+        vis = create_visualizer(config, trees, config.output_file,
+            forgery_states, relations)
+        try:
+            vis.visualize()
+        except RenderTimeoutException as e:
+            store.close(remove=True)
+            sys.exit(f"could not render: {e}")
+
+    # The run is complete, the checkpoints and trees are no longer needed
+    store.close(remove=True)
+    for checkpoint in checkpoints.values():
+        checkpoint.clear()
+    if os.path.isdir(config.checkpoint_dir) and \
+            not os.listdir(config.checkpoint_dir):
+        os.rmdir(config.checkpoint_dir)